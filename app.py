@@ -2,20 +2,52 @@
 
 import argparse
 import getpass
+import os
+import sys
+from collections import Counter
 from pathlib import Path
 from typing import Iterable, List, Optional
 
 from ai_helper import AIHelpStore, ApiKeyStore, fetch_ai_help
-from requirements_parser import Compendium, Requirement, load_compendium
+from model_export import export_jsonl, export_model
+from requirements_parser import Compendium, Requirement, load_compendia
+from similarity import SimilarityIndex, find_reusable_help, format_reused_help, load_or_build_index
+from status_history import StatusEvent, StatusHistory, parse_date
+from status_import import IMPORT_FORMATS, ImportResult, apply_import, plan_import, read_rows
 from status_store import StatusStore, VALID_STATUSES
 
 
+DEFAULT_XML = "XML_Kompendium_2023.xml"
+
+
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="CLI zum Arbeiten mit dem IT-Grundschutz-Kompendium.")
-    parser.add_argument("--xml", default="XML_Kompendium_2023.xml", help="Pfad zur XML-Datei des Kompendiums.")
+    parser.add_argument(
+        "--xml",
+        action="append",
+        help="Pfad zur XML-Datei des Kompendiums; mehrfach angeben fuer weitere Editionen oder eigene Bausteine "
+        "(Standard: XML_Kompendium_2023.xml).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Anzahl paralleler Prozesse beim Parsen (0 = alle CPU-Kerne).",
+    )
     parser.add_argument("--status-file", default="status.json", help="Pfad zur Status-Datei (JSON).")
+    parser.add_argument(
+        "--history-file",
+        default="status_history.jsonl",
+        help="Pfad zum Aenderungsprotokoll der Status (JSON Lines, wird nur ergaenzt).",
+    )
+    parser.add_argument("--user", help="Benutzername fuer das Aenderungsprotokoll (Standard: Login-Name).")
     parser.add_argument("--api-key-file", default="openai_key.txt", help="Pfad zur Datei mit dem OpenAI API-Key.")
     parser.add_argument("--ai-help-file", default="ai_help_store.json", help="Pfad zur Datei fuer gespeicherte KI-Hilfen.")
+    parser.add_argument(
+        "--similarity-file",
+        default="similarity_index.bin",
+        help="Pfad zum vorberechneten Aehnlichkeitsindex (wird bei Bedarf neu erzeugt).",
+    )
 
     subparsers = parser.add_subparsers(dest="command", required=True)
 
@@ -34,14 +66,59 @@ def build_parser() -> argparse.ArgumentParser:
     set_parser.add_argument("status", choices=VALID_STATUSES, help="Neuer Status.")
     set_parser.add_argument("--note", help="Optionaler Kommentar.")
 
+    import_parser = subparsers.add_parser("import-status", help="Status aus CSV/JSON/JSONL gesammelt uebernehmen.")
+    import_parser.add_argument("file", help="Importdatei mit den Spalten code, status und optional note.")
+    import_parser.add_argument("--format", choices=IMPORT_FORMATS, help="Dateiformat (Standard: anhand der Endung).")
+    import_parser.add_argument(
+        "--replace-notes",
+        action="store_true",
+        help="Notizen immer ersetzen; leere Felder loeschen die Notiz (Standard: leere Felder behalten sie).",
+    )
+    import_parser.add_argument("--dry-run", action="store_true", help="Nur Aenderungen und Fehler anzeigen.")
+    import_parser.add_argument(
+        "--ignore-errors",
+        action="store_true",
+        help="Gueltige Zeilen trotz fehlerhafter Zeilen uebernehmen (Standard: Import abbrechen).",
+    )
+
     list_parser = subparsers.add_parser("statuses", help="Alle gesetzten Status anzeigen.")
     list_parser.add_argument("--status", choices=VALID_STATUSES, help="Nur bestimmte Status anzeigen.")
+    list_parser.add_argument("--as-of", help="Stand zu einem Datum aus dem Aenderungsprotokoll, z. B. 2024-03-31.")
+
+    history_parser = subparsers.add_parser("history", help="Aenderungsverlauf einer Anforderung anzeigen.")
+    history_parser.add_argument("requirement_code", help="Anforderungscode.")
+
+    changes_parser = subparsers.add_parser("changes", help="Aenderungen in einem Zeitraum anzeigen.")
+    changes_parser.add_argument("--since", required=True, help="Beginn des Zeitraums, z. B. 2024-01-01.")
+    changes_parser.add_argument("--until", help="Ende des Zeitraums (einschliesslich), z. B. 2024-03-31.")
 
     api_parser = subparsers.add_parser("set-api-key", help="OpenAI API-Key speichern.")
     api_parser.add_argument("--key", help="Optional: API-Key direkt uebergeben.")
 
     ai_parser = subparsers.add_parser("ai-help", help="KI-Hilfe generieren und speichern.")
     ai_parser.add_argument("requirement_code", help="Anforderungscode.")
+    ai_parser.add_argument(
+        "--reuse-similar",
+        action="store_true",
+        help="Gespeicherte KI-Hilfe einer sehr aehnlichen Anforderung uebernehmen statt OpenAI abzufragen.",
+    )
+
+    refs_parser = subparsers.add_parser("refs", help="Querverweise einer Anforderung oder eines Bausteins anzeigen.")
+    refs_parser.add_argument("code", help="Anforderungs- oder Bausteincode.")
+    refs_parser.add_argument("--reverse", action="store_true", help="Eingehende Verweise (Auswirkungsanalyse) anzeigen.")
+    refs_parser.add_argument("--depth", type=int, help="Maximale Verweistiefe (Standard: unbegrenzt).")
+
+    export_parser = subparsers.add_parser("export-model", help="Bausteine und Anforderungen maschinenlesbar exportieren.")
+    export_parser.add_argument("output", help="Zieldatei, z. B. kompendium.bin oder kompendium.jsonl.")
+    export_parser.add_argument(
+        "--format",
+        choices=["binary", "jsonl"],
+        help="Exportformat (Standard: jsonl bei Endung .jsonl, sonst binary).",
+    )
+
+    similar_parser = subparsers.add_parser("similar", help="Aehnliche Anforderungen anzeigen.")
+    similar_parser.add_argument("requirement_code", help="Anforderungscode.")
+    similar_parser.add_argument("--limit", type=int, default=5, help="Anzahl der angezeigten Anforderungen.")
 
     return parser
 
@@ -50,8 +127,10 @@ def main() -> None:
     parser = build_parser()
     args = parser.parse_args()
 
-    compendium = load_compendium(Path(args.xml))
-    status_store = StatusStore(Path(args.status_file))
+    compendium = load_compendia([Path(path) for path in args.xml or [DEFAULT_XML]], args.jobs or os.cpu_count() or 1)
+    _warn_conflicts(compendium)
+    history = StatusHistory(Path(args.history_file))
+    status_store = StatusStore(Path(args.status_file), history, args.user)
     api_key_store = ApiKeyStore(Path(args.api_key_file))
     ai_help_store = AIHelpStore(Path(args.ai_help_file))
 
@@ -63,16 +142,49 @@ def main() -> None:
         _cmd_show(compendium, status_store, ai_help_store, args.requirement_code)
     elif args.command == "set-status":
         _cmd_set_status(compendium, status_store, args.requirement_code, args.status, args.note)
+    elif args.command == "import-status":
+        _cmd_import_status(
+            compendium,
+            status_store,
+            Path(args.file),
+            args.format,
+            args.replace_notes,
+            args.dry_run,
+            args.ignore_errors,
+        )
     elif args.command == "statuses":
-        _cmd_statuses(compendium, status_store, args.status)
+        _cmd_statuses(compendium, status_store, args.status, args.as_of)
+    elif args.command == "history":
+        _cmd_history(compendium, history, args.requirement_code)
+    elif args.command == "changes":
+        _cmd_changes(compendium, history, args.since, args.until)
     elif args.command == "set-api-key":
         _cmd_set_api_key(api_key_store, args.key)
     elif args.command == "ai-help":
-        _cmd_ai_help(compendium, api_key_store, ai_help_store, args.requirement_code)
+        similarity_index = load_or_build_index(compendium, Path(args.similarity_file)) if args.reuse_similar else None
+        _cmd_ai_help(compendium, api_key_store, ai_help_store, args.requirement_code, similarity_index)
+    elif args.command == "refs":
+        _cmd_refs(compendium, status_store, args.code, args.reverse, args.depth)
+    elif args.command == "export-model":
+        _cmd_export_model(compendium, Path(args.output), args.format)
+    elif args.command == "similar":
+        similarity_index = load_or_build_index(compendium, Path(args.similarity_file))
+        _cmd_similar(compendium, status_store, ai_help_store, similarity_index, args.requirement_code, args.limit)
     else:
         parser.print_help()
 
 
+def _warn_conflicts(compendium: Compendium) -> None:
+    if not compendium.conflicts:
+        return
+    first = compendium.conflicts[0]
+    print(
+        f"Warnung: {len(compendium.conflicts)} doppelte Codes ignoriert, die zuerst genannte Datei gewinnt "
+        f"(z. B. {first.code} aus {first.ignored_source}).",
+        file=sys.stderr,
+    )
+
+
 def _cmd_modules(compendium: Compendium, store: StatusStore, search: Optional[str]) -> None:
     search_lower = search.lower() if search else None
     for module in compendium.modules.values():
@@ -113,6 +225,8 @@ def _cmd_show(compendium: Compendium, store: StatusStore, ai_help_store: AIHelpS
     print(f"{req.code} - {req.title}")
     print(f"Kapitel: {req.chapter} | Baustein: {req.module_code} {req.module_title}")
     print(f"Level: {req.level} | Rollen: {', '.join(req.roles) if req.roles else '---'}")
+    if len(set(compendium.sources.values())) > 1:
+        print(f"Quelle: {compendium.sources.get(req.code, '-')}")
     print(f"Status: {status.get('status', 'open')} | Notiz: {status.get('note', '-')}")
     print("\nBeschreibung:")
     print(req.description or "(Kein Beschreibungstext gefunden.)")
@@ -140,6 +254,55 @@ def _cmd_set_status(
     print(f"Status fuer {requirement_code} aktualisiert: {status}")
 
 
+def _cmd_import_status(
+    compendium: Compendium,
+    store: StatusStore,
+    path: Path,
+    import_format: Optional[str],
+    replace_notes: bool,
+    dry_run: bool,
+    ignore_errors: bool = False,
+) -> None:
+    try:
+        result = plan_import(read_rows(path, import_format), compendium, store, replace_notes)
+    except (OSError, ValueError) as error:
+        print(f"Import fehlgeschlagen: {error}")
+        return
+    _print_import_summary(result, dry_run)
+    if dry_run:
+        return
+    if result.errors and not ignore_errors:
+        # Import ist eine Transaktion: entweder alle Zeilen oder keine
+        print("Import abgebrochen, nichts gespeichert. Fehler korrigieren oder --ignore-errors angeben.")
+        return
+    apply_import(result, store)
+    print(f"{len(result.changes)} Aenderungen gespeichert.")
+
+
+def _print_import_summary(result: ImportResult, dry_run: bool) -> None:
+    transitions = Counter(
+        f"{change.old_status or 'open'} -> {change.new_status}"
+        if (change.old_status or "open") != change.new_status
+        else f"{change.new_status} (nur Notiz)"
+        for change in result.changes
+    )
+    print(
+        f"{result.rows} Zeilen gelesen: {len(result.changes)} Aenderungen, {result.unchanged} unveraendert, "
+        f"{len(result.errors)} Fehler."
+    )
+    for transition, count in sorted(transitions.items()):
+        print(f"  {transition}: {count}")
+    if dry_run:
+        for change in result.changes:
+            line = f"  {change.requirement_code}: {change.old_status or 'open'} -> {change.new_status}"
+            if (change.old_note or "") != (change.new_note or ""):
+                line += f" | Notiz: {change.old_note or '-'} -> {change.new_note or '-'}"
+            print(line)
+    for error in result.errors[:20]:
+        print(f"  Fehler: {error}")
+    if len(result.errors) > 20:
+        print(f"  ... {len(result.errors) - 20} weitere Fehler")
+
 
 def _cmd_set_api_key(api_key_store: ApiKeyStore, key_arg: Optional[str]) -> None:
     key = key_arg or getpass.getpass("OpenAI API-Key: ")
@@ -156,11 +319,21 @@ def _cmd_ai_help(
     api_key_store: ApiKeyStore,
     help_store: AIHelpStore,
     requirement_code: str,
+    similarity_index: Optional[SimilarityIndex] = None,
 ) -> None:
     req = compendium.get_requirement(requirement_code)
     if req is None:
         print(f"Anforderung {requirement_code} nicht gefunden.")
         return
+    if similarity_index is not None:
+        reusable = find_reusable_help(similarity_index, help_store, req.code)
+        if reusable:
+            content = format_reused_help(*reusable)
+            help_store.save_help(req.code, content)
+            print("KI-Hilfe uebernommen und gespeichert.")
+            print(content)
+            return
+        print("Keine wiederverwendbare KI-Hilfe gefunden, frage OpenAI ab.")
     api_key = api_key_store.load_key()
     if not api_key:
         print("Kein API-Key gespeichert. Bitte zuerst 'python app.py set-api-key' ausfuehren.")
@@ -174,8 +347,93 @@ def _cmd_ai_help(
     print("KI-Hilfe gespeichert.")
     print(content)
 
-def _cmd_statuses(compendium: Compendium, store: StatusStore, status_filter: Optional[str]) -> None:
-    for req_code, data in store.iter_statuses():
+
+def _cmd_refs(
+    compendium: Compendium,
+    store: StatusStore,
+    code: str,
+    reverse: bool,
+    depth: Optional[int],
+) -> None:
+    req = compendium.get_requirement(code)
+    module = compendium.get_module(code)
+    if req is None and module is None:
+        print(f"Anforderung oder Baustein {code} nicht gefunden.")
+        return
+    title = req.title if req else module.title
+    distances = compendium.resolve_references(code, reverse, depth)
+    direction = "Verweise auf" if reverse else "Verweise von"
+    if not distances:
+        print(f"Keine {direction} {code} gefunden.")
+        return
+    # flache Liste mit Tiefe: ein Code kann ueber mehrere Pfade erreicht werden
+    print(f"{direction} {code} - {title} ([Tiefe] Code):")
+    for target, distance in sorted(distances.items(), key=lambda item: (item[1], item[0])):
+        target_req = compendium.get_requirement(target)
+        if target_req:
+            status = store.get_status(target) or "open"
+            print(f"  [{distance}] {target}: {target_req.title} - Status: {status}")
+        else:
+            print(f"  [{distance}] {target}: Baustein {compendium.modules[target].title}")
+
+    referenced = compendium.referenced_requirements(code, reverse, depth)
+    counts = Counter(store.get_status(other.code) or "open" for other in referenced)
+    pending = counts["open"] + counts["in_progress"]
+    summary = ", ".join(f"{status}: {counts[status]}" for status in VALID_STATUSES if counts[status])
+    print(f"\nNoch offen: {pending} von {len(referenced)} verwiesenen Anforderungen ({summary})")
+
+
+def _cmd_export_model(compendium: Compendium, output: Path, export_format: Optional[str]) -> None:
+    export_format = export_format or ("jsonl" if output.suffix.lower() == ".jsonl" else "binary")
+    if export_format == "jsonl":
+        export_jsonl(compendium, output)
+    else:
+        export_model(compendium, output)
+    print(f"{len(compendium.modules)} Bausteine und {len(compendium.requirements)} Anforderungen nach {output} exportiert.")
+
+
+def _cmd_similar(
+    compendium: Compendium,
+    store: StatusStore,
+    help_store: AIHelpStore,
+    index: SimilarityIndex,
+    requirement_code: str,
+    limit: int,
+) -> None:
+    req = compendium.get_requirement(requirement_code)
+    if req is None:
+        print(f"Anforderung {requirement_code} nicht gefunden.")
+        return
+    neighbours = index.neighbours(req.code, limit)
+    if not neighbours:
+        print(f"Keine aehnlichen Anforderungen zu {req.code} gefunden.")
+        return
+    print(f"Aehnlich zu {req.code} - {req.title}:")
+    for code, score in neighbours:
+        other = compendium.get_requirement(code)
+        title = other.title if other else "Unbekannte Anforderung"
+        status = store.get_status(code) or "open"
+        help_flag = "KI-Hilfe vorhanden" if help_store.get_help(code) else "keine KI-Hilfe"
+        print(f"  {score:.2f} {code}: {title} - Status: {status} - {help_flag}")
+
+
+def _cmd_statuses(
+    compendium: Compendium,
+    store: StatusStore,
+    status_filter: Optional[str],
+    as_of: Optional[str] = None,
+) -> None:
+    if as_of:
+        try:
+            when = parse_date(as_of, end_of_day=True)
+        except ValueError:
+            print(f"Ungueltiges Datum: {as_of}")
+            return
+        current = dict(store.iter_statuses())
+        entries = store.history.state_as_of(when, current).items() if store.history is not None else current.items()
+    else:
+        entries = store.iter_statuses()
+    for req_code, data in entries:
         if status_filter and data.get("status") != status_filter:
             continue
         req = compendium.get_requirement(req_code)
@@ -183,7 +441,44 @@ def _cmd_statuses(compendium: Compendium, store: StatusStore, status_filter: Opt
         print(f"{req_code}: {title} - Status: {data.get('status')} - Notiz: {data.get('note', '-')}")
 
 
-if __name__ == "__main__":
-    main()
+def _cmd_history(compendium: Compendium, history: StatusHistory, requirement_code: str) -> None:
+    req = compendium.get_requirement(requirement_code)
+    if req is None:
+        print(f"Anforderung {requirement_code} nicht gefunden.")
+        return
+    events = history.events_for(req.code)
+    if not events:
+        print(f"Keine Aenderungen fuer {req.code} protokolliert.")
+        return
+    print(f"{req.code} - {req.title}")
+    for event in events:
+        print(f"  {_format_event(event)}")
 
 
+def _cmd_changes(compendium: Compendium, history: StatusHistory, since: str, until: Optional[str]) -> None:
+    try:
+        since_date = parse_date(since)
+        until_date = parse_date(until, end_of_day=True) if until else None
+    except ValueError as error:
+        print(f"Ungueltiges Datum: {error}")
+        return
+    events = history.changes(since_date, until_date)
+    if not events:
+        print("Keine Aenderungen im angegebenen Zeitraum.")
+        return
+    for event in events:
+        req = compendium.get_requirement(event.requirement_code)
+        title = req.title if req else "Unbekannte Anforderung"
+        print(f"{event.requirement_code}: {title}")
+        print(f"  {_format_event(event)}")
+
+
+def _format_event(event: StatusEvent) -> str:
+    line = f"{event.timestamp} {event.user}: {event.old_status or '-'} -> {event.new_status or '-'}"
+    if event.old_note != event.new_note:
+        line += f" | Notiz: {event.old_note or '-'} -> {event.new_note or '-'}"
+    return line
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+﻿from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+from model_export import CompendiumModel, export_model
+from requirements_parser import load_compendia, load_compendium, split_chapters
+from search_index import RequirementIndex, RequirementQuery
+from status_history import StatusHistory
+from status_import import apply_import, plan_import, read_rows
+from status_store import StatusStore, VALID_STATUSES
+from text_utils import TextNormalizer, normalize_text
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Micro-Benchmarks fuer das Kompendium-Toolset.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    history_parser = subparsers.add_parser("history", help="Stichtagsabfragen auf dem Aenderungsprotokoll.")
+    history_parser.add_argument("--events", type=int, default=50_000, help="Anzahl synthetischer Ereignisse.")
+    history_parser.add_argument("--requirements", type=int, default=2_000, help="Anzahl unterschiedlicher Codes.")
+
+    export_parser = subparsers.add_parser("export", help="Modelldatei oeffnen/abfragen vs. XML neu parsen.")
+    export_parser.add_argument("--xml", help="Kompendium-XML (Standard: synthetisches Kompendium).")
+    export_parser.add_argument("--modules", type=int, default=120, help="Bausteine im synthetischen Kompendium.")
+
+    normalize_parser = subparsers.add_parser("normalize", help="TextNormalizer vs. normalize_text inkl. Golden-Vergleich.")
+    normalize_parser.add_argument("--modules", type=int, default=120, help="Bausteine im synthetischen Kompendium.")
+
+    parse_parser = subparsers.add_parser("parse", help="Paralleles Parsen mehrerer Dateien mit 1-8 Prozessen.")
+    parse_parser.add_argument("--files", type=int, default=4, help="Anzahl synthetischer XML-Dateien.")
+    parse_parser.add_argument("--modules", type=int, default=400, help="Bausteine je Datei.")
+
+    import_parser = subparsers.add_parser("import", help="Sammelimport von Statuswerten aus CSV.")
+    import_parser.add_argument("--rows", type=int, default=10_000, help="Anzahl der CSV-Zeilen.")
+
+    filter_parser = subparsers.add_parser("filter", help="Latenz des GUI-Live-Filters bei 10-facher Groesse.")
+    filter_parser.add_argument("--modules", type=int, default=1_200, help="Bausteine (ca. 10x Kompendium 2023).")
+
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    if args.benchmark == "history":
+        _bench_history(args.events, args.requirements)
+    elif args.benchmark == "export":
+        _bench_export(args.xml, args.modules)
+    elif args.benchmark == "parse":
+        _bench_parse(args.files, args.modules)
+    elif args.benchmark == "import":
+        _bench_import(args.rows)
+    elif args.benchmark == "filter":
+        _bench_filter(args.modules)
+    elif args.benchmark == "normalize":
+        _bench_normalize(args.modules)
+
+
+def _timed(label: str, func: Callable, repeat: int = 5):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<45} {best * 1000:9.2f} ms")
+    return result
+
+
+def write_synthetic_xml(
+    path: Path,
+    module_count: int,
+    requirements_per_module: int = 12,
+    seed: int = 7,
+    first_chapter: int = 1,
+) -> List[str]:
+    """Erzeugt ein DocBook-Kompendium mit realistischer Struktur und liefert die Anforderungscodes.
+
+    Ueber ``first_chapter`` lassen sich mehrere Dateien ohne ueberschneidende Codes erzeugen.
+    """
+    rng = random.Random(seed)
+    vocabulary = [
+        "Patchmanagement", "Protokollierung", "Datensicherung", "Rollenkonzept", "Administratoren",
+        "Benutzerkonten", "Konfiguration", "Server", "Netzsegment", "Clients", "Updates", "Richtlinie",
+        "Dokumentation", "Zugriffsrechte", "Passwoerter", "Verschlüsselung", "Wiederherstellung",
+        "Überwachung", "Schnittstellen", "Dienste", "Sicherheitskonzept", "Notfallplanung", "Härtung",
+        "Schadprogramme", "Authentisierung", "Fernwartung", "Speicherplatz", "Zuständigkeiten",
+    ]
+    fillers = ["die", "der", "sollte", "MUSS", "regelmäßig", "geeignete", "für", "alle", "und", "werden"]
+    prefixes = ["ISMS", "ORP", "CON", "OPS", "DER", "APP", "SYS", "IND", "NET", "INF"]
+    roles = ["IT-Betrieb", "Informationssicherheitsbeauftragte (ISB)", "Planende", "Fachverantwortliche"]
+
+    def sentence() -> str:
+        words = [rng.choice(vocabulary if rng.random() < 0.4 else fillers) for _ in range(rng.randint(12, 30))]
+        return " ".join(words).capitalize() + "."
+
+    codes: List[str] = []
+    module_codes: List[str] = []
+    parts = ['<?xml version="1.0" encoding="utf-8"?>', '<book xmlns="http://docbook.org/ns/docbook">']
+    per_chapter = max(1, module_count // len(prefixes))
+    for chapter_number, prefix in enumerate(prefixes, start=first_chapter):
+        parts.append(f"<chapter><title>{prefix} – Kapitel {chapter_number}</title>")
+        for module_number in range(1, per_chapter + 1):
+            module_code = f"{prefix}.{chapter_number}.{module_number}"
+            parts.append(f"<section><title>{module_code} {escape(rng.choice(vocabulary))} „{module_number}“</title>")
+            parts.append(f"<section><title>Beschreibung</title><para>{escape(sentence())}</para></section>")
+            parts.append("<section><title>Anforderungen</title>")
+            for requirement_number in range(1, requirements_per_module + 1):
+                code = f"{module_code}.A{requirement_number}"
+                title = f"{rng.choice(vocabulary)} {rng.choice(vocabulary)}"
+                level = rng.choice("BSH")
+                role = rng.choice(roles)
+                paragraphs = [sentence() for _ in range(rng.randint(1, 4))]
+                if codes and rng.random() < 0.3:
+                    paragraphs[-1] += f" Siehe auch {rng.choice(codes)} und {rng.choice(module_codes or [module_code])}."
+                body = "".join(f"<para>{escape(text)}</para>" for text in paragraphs)
+                parts.append(f"<section><title>{code} {escape(title)} ({level}) [{escape(role)}]</title>{body}</section>")
+                codes.append(code)
+            parts.append("</section></section>")
+            module_codes.append(module_code)
+        parts.append("</chapter>")
+    parts.append("</book>")
+    path.write_text("\n".join(parts), encoding="utf-8")
+    return codes
+
+
+def _bench_history(event_count: int, requirement_count: int) -> None:
+    rng = random.Random(42)
+    codes = [f"SYS.{n // 100}.{n % 100}.A{n % 7 + 1}" for n in range(requirement_count)]
+    start = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    step = timedelta(days=365) / event_count
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "status_history.jsonl"
+        history = StatusHistory(path)
+        current: Dict[str, Dict[str, str]] = {}
+        for position in range(event_count):
+            code = rng.choice(codes)
+            new = {"status": rng.choice(VALID_STATUSES), "note": f"Pruefung {position}"}
+            history.record(code, current.get(code), new, "benchmark", start + step * position)
+            current[code] = new
+        history.flush()
+        print(f"{len(history)} Ereignisse fuer {requirement_count} Anforderungen")
+
+        # der Index wird erst beim ersten Zugriff geladen, len() erzwingt das
+        history = _timed("Protokoll oeffnen (Index laden)", lambda: _loaded_history(path))
+        checkpoints = [start + timedelta(days=days) for days in (30, 180, 364)]
+        for when in checkpoints:
+            indexed = _timed(f"state_as_of {when:%Y-%m-%d} (Index)", lambda: history.state_as_of(when))
+            replayed = _timed(f"state_as_of {when:%Y-%m-%d} (Replay)", lambda: _replay(path, when))
+            assert indexed == replayed, "Index und Replay liefern unterschiedliche Staende"
+        since, until = start + timedelta(days=100), start + timedelta(days=107)
+        changes = _timed("changes ueber 7 Tage", lambda: history.changes(since, until))
+        print(f"  {len(changes)} Aenderungen im Zeitraum")
+
+
+def _loaded_history(path: Path) -> StatusHistory:
+    history = StatusHistory(path)
+    len(history)
+    return history
+
+
+def _replay(path: Path, when: datetime) -> Dict[str, Dict[str, str]]:
+    # Referenz: komplettes Log abspielen, wie es ohne Zeitindex noetig waere
+    state: Dict[str, Dict[str, str]] = {}
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            event = json.loads(line)
+            if datetime.fromisoformat(event["timestamp"]) >= when:
+                break
+            state[event["requirement_code"]] = {"status": event["new_status"], "note": event["new_note"]}
+    return dict(sorted(state.items()))
+
+
+def _bench_export(xml: Optional[str], module_count: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = Path(xml) if xml else Path(tmp) / "kompendium.xml"
+        if not xml:
+            write_synthetic_xml(xml_path, module_count)
+        model_path = Path(tmp) / "kompendium.bin"
+        compendium = _timed("XML parsen (load_compendium)", lambda: load_compendium(xml_path), repeat=3)
+        export_model(compendium, model_path)
+        print(f"{len(compendium.requirements)} Anforderungen, Modell {model_path.stat().st_size / 1024:.0f} KiB")
+
+        def open_close() -> None:
+            CompendiumModel(model_path).close()
+
+        _timed("Modell oeffnen (mmap)", open_close)
+        codes = sorted(compendium.requirements)
+        rng = random.Random(1)
+        sample = [rng.choice(codes) for _ in range(1_000)]
+        with CompendiumModel(model_path) as model:
+            _timed("1000 Lookups per Code (Modell)", lambda: [model.get_requirement(code) for code in sample])
+            assert all(model.get_requirement(code) == compendium.requirements[code] for code in sample)
+        _timed("Oeffnen + 1 Lookup (Modell)", lambda: _open_and_lookup(model_path, sample[0]))
+
+
+def _open_and_lookup(model_path: Path, code: str):
+    with CompendiumModel(model_path) as model:
+        return model.get_requirement(code)
+
+
+def _bench_parse(file_count: int, module_count: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for number in range(file_count):
+            path = Path(tmp) / f"kompendium_{number}.xml"
+            write_synthetic_xml(path, module_count, seed=number, first_chapter=1 + number * 10)
+            paths.append(path)
+        size = sum(path.stat().st_size for path in paths) / 1024 / 1024
+        print(f"{file_count} Dateien, zusammen {size:.1f} MiB, {os.cpu_count()} CPU-Kerne")
+        baseline = None
+        for jobs in (1, 2, 4, 8):
+            compendium = _timed(f"load_compendia mit {jobs} Prozess(en)", lambda: load_compendia(paths, jobs), repeat=3)
+            if baseline is None:
+                baseline = compendium
+            assert compendium.requirements == baseline.requirements, "Ergebnis haengt von der Prozesszahl ab"
+        print(f"  {len(baseline.requirements)} Anforderungen, {len(baseline.conflicts)} Konflikte")
+
+        # eine einzelne Datei wird in nach Groesse ausgeglichene Kapitelgruppen zerlegt
+        single = paths[:1]
+        _timed("Kapitelgrenzen ermitteln (Elternprozess)", lambda: split_chapters(str(single[0])))
+        _timed("ET.parse der ganzen Datei (Vergleich)", lambda: ET.parse(single[0]))
+        baseline = None
+        for jobs in (1, 2, 4, 8):
+            compendium = _timed(f"eine Datei mit {jobs} Prozess(en)", lambda: load_compendia(single, jobs), repeat=3)
+            if baseline is None:
+                baseline = compendium
+            assert compendium.requirements == baseline.requirements, "Ergebnis haengt von der Prozesszahl ab"
+
+
+def _bench_import(row_count: int) -> None:
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = Path(tmp) / "kompendium.xml"
+        codes = write_synthetic_xml(xml_path, module_count=row_count // 12 + 10)
+        csv_path = Path(tmp) / "audit.csv"
+        with csv_path.open("w", encoding="utf-8", newline="") as handle:
+            writer = csv.writer(handle, delimiter=";")
+            writer.writerow(["code", "status", "note"])
+            for code in rng.sample(codes, row_count):
+                writer.writerow([code, rng.choice(VALID_STATUSES), rng.choice(["", "geprueft im Audit"])])
+
+        compendium = load_compendium(xml_path)
+        print(f"{row_count} Zeilen gegen {len(compendium.requirements)} Anforderungen")
+
+        def run_import() -> None:
+            status_path = Path(tmp) / "status.json"
+            history_path = Path(tmp) / "status_history.jsonl"
+            for path in (status_path, history_path, history_path.with_name(history_path.name + ".idx")):
+                path.unlink(missing_ok=True)
+            store = StatusStore(status_path, StatusHistory(history_path), "benchmark")
+            result = plan_import(read_rows(csv_path), compendium, store)
+            assert not result.errors, result.errors[:3]
+            apply_import(result, store)
+
+        _timed("import-status (lesen, pruefen, speichern)", run_import)
+
+
+def _bench_filter(module_count: int) -> None:
+    # Import erst hier, da gui.py tkinter laedt
+    from gui import FILTER_DEBOUNCE_MS, RESULT_CHUNK_SIZE
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = Path(tmp) / "kompendium.xml"
+        write_synthetic_xml(xml_path, module_count)
+        compendium = load_compendium(xml_path)
+    rng = random.Random(9)
+    statuses = {code: rng.choice(VALID_STATUSES) for code in compendium.requirements}
+    print(f"{len(compendium.requirements)} Anforderungen in {len(compendium.modules)} Bausteinen")
+
+    index = _timed("RequirementIndex aufbauen", lambda: RequirementIndex(compendium), repeat=3)
+    role = index.roles[0]
+    worst = 0.0
+    typed = "patchmanagement server"
+    for length in range(1, len(typed) + 1):
+        query = RequirementQuery(text=typed[:length])
+        start = time.perf_counter()
+        index.search(query, statuses)
+        worst = max(worst, time.perf_counter() - start)
+    print(f"{'schlechteste Abfrage beim Tippen':<45} {worst * 1000:9.2f} ms")
+
+    combined = RequirementQuery(text="server", level="S", role=role, status="open")
+    results = _timed("Text + Level + Rolle + Status", lambda: index.search(combined, statuses))
+    everything = _timed("alle Anforderungen (nur Statusfilter)", lambda: index.search(RequirementQuery(status="done"), statuses))
+    _timed(
+        "erster Block formatieren",
+        lambda: [f"{req.code} [{statuses.get(req.code, 'open')}] {req.title}" for req in everything[:RESULT_CHUNK_SIZE]],
+    )
+    cancelled = _timed("abgebrochene Abfrage", lambda: index.search(RequirementQuery(text="x"), statuses, lambda: True))
+    assert cancelled is None
+    print(f"  {len(results)} bzw. {len(everything)} Treffer")
+    print(f"Tastendruck bis erstes Ergebnis: ca. {FILTER_DEBOUNCE_MS} ms Entprellung + {worst * 1000:.1f} ms Abfrage")
+
+
+# Randfaelle, fuer die TextNormalizer exakt wie normalize_text arbeiten muss. Das Repository hat
+# keine Testsuite; der Vergleich laeuft nur bei "python bench.py normalize" und muss nach
+# Aenderungen an text_utils.py von Hand ausgefuehrt werden.
+GOLDEN_SAMPLES = [
+    "",
+    "APP.1.1.A3 Rollen (B) [IT-Betrieb]",
+    "Verschlüsselung – „sicher“",
+    "Verschl\xc3\xbcsselung \xe2\x80\x93 Mojibake",
+    "Gemischt: Verschl\xc3\xbcsselung und echtes ü",
+    "Nur ein Startbyte \xc3 ohne Folgezeichen",
+    "Ungültige Folge \xc3\x28",
+    "Zeichen jenseits latin1 \u20ac mit \xc3\xbc",
+    "\u201aeinfach\u2018 und \u2014 Strich",
+    "\xf0\x9f\x94\x92 Schloss",
+]
+
+
+def _bench_normalize(module_count: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = Path(tmp) / "kompendium.xml"
+        write_synthetic_xml(xml_path, module_count)
+        root = ET.parse(str(xml_path)).getroot()
+    corpus = ["".join(element.itertext()) for element in root.iter() if element.text and element.text.strip()]
+    mojibake = [text.encode("utf-8").decode("latin1") for text in corpus[::10]]
+    print(f"{len(corpus)} Texte, davon {len(mojibake)} zusaetzlich als Mojibake")
+
+    for label, texts in (("sauber", corpus), ("mit Mojibake", corpus + mojibake + GOLDEN_SAMPLES)):
+        expected = _timed(f"normalize_text ({label})", lambda: [normalize_text(text) for text in texts])
+
+        def run_normalizer() -> List[str]:
+            normalizer = TextNormalizer()
+            normalizer.scan("".join(texts))
+            return [normalizer(text) for text in texts]
+
+        actual = _timed(f"TextNormalizer ({label})", run_normalizer)
+        assert actual == expected, "TextNormalizer weicht von normalize_text ab"
+
+    forced = TextNormalizer()
+    assert [forced(text) for text in GOLDEN_SAMPLES] == [normalize_text(text) for text in GOLDEN_SAMPLES]
+    print("Golden-Vergleich: identische Ausgaben")
+
+
+if __name__ == "__main__":
+    main()
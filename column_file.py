@@ -0,0 +1,130 @@
+﻿from __future__ import annotations
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, Sequence
+
+ALIGNMENT = 8
+
+
+def write_column_file(path: Path, magic: bytes, header: Dict[str, object], columns: Dict[str, array]) -> None:
+    """Schreibt ``columns`` spaltenweise in eine Binaerdatei.
+
+    Aufbau: ``magic``, Laenge des JSON-Headers (uint32, little endian), JSON-Header, danach auf
+    8 Byte ausgerichtete Spalten in little endian. ``header`` wird um ``byteorder`` und
+    ``columns`` (Offset relativ zum Datenbereich, Elementanzahl, ``array``-Typcode) ergaenzt.
+    """
+    if sys.byteorder != "little":
+        swapped = {}
+        for name, column in columns.items():
+            column = array(column.typecode, column)
+            column.byteswap()
+            swapped[name] = column
+        columns = swapped
+
+    layout = {}
+    offset = 0
+    for name, column in columns.items():
+        layout[name] = {"offset": offset, "length": len(column), "type": column.typecode}
+        offset = align(offset + len(column) * column.itemsize)
+    encoded = json.dumps({**header, "byteorder": "little", "columns": layout}, ensure_ascii=False).encode("utf-8")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("wb") as handle:
+        handle.write(magic)
+        handle.write(struct.pack("<I", len(encoded)))
+        handle.write(encoded)
+        _pad(handle)
+        for column in columns.values():
+            column.tofile(handle)
+            _pad(handle)
+
+
+class ColumnFile:
+    """Oeffnet eine ``write_column_file``-Datei per ``mmap``.
+
+    Auf little-endian-Systemen sind die Spalten ``memoryview``-Objekte direkt auf die
+    gemappte Datei, sonst byteweise gedrehte Kopien. Fehlerhafte Dateien fuehren zu
+    ``ValueError``; Datei und Mapping sind dann bereits wieder geschlossen.
+    """
+
+    def __init__(self, path: Path, magic: bytes):
+        self.path = path
+        self.columns: Dict[str, Sequence] = {}
+        self._view = None
+        self._handle = path.open("rb")
+        try:
+            self._map = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._handle.close()
+            raise ValueError(f"Leere Datei: {path}")
+        try:
+            self._open(magic)
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self, magic: bytes) -> None:
+        if self._map[: len(magic)] != magic:
+            raise ValueError(f"Unbekanntes Dateiformat: {self.path}")
+        try:
+            (header_size,) = struct.unpack_from("<I", self._map, len(magic))
+            header_start = len(magic) + 4
+            self.header = json.loads(self._map[header_start : header_start + header_size].decode("utf-8"))
+        except (struct.error, UnicodeDecodeError, json.JSONDecodeError) as error:
+            raise ValueError(f"Beschaedigter Header in {self.path}: {error}") from error
+        if not isinstance(self.header, dict) or not isinstance(self.header.get("columns"), dict):
+            raise ValueError(f"Beschaedigter Header in {self.path}")
+        if self.header.get("byteorder") != "little":
+            raise ValueError(f"Unbekannte Byte-Reihenfolge in {self.path}")
+        data_start = align(header_start + header_size)
+        self._view = memoryview(self._map)
+        # schrittweise fuellen, damit close() auch nach einem Fehler alle Views freigibt
+        for name, spec in self.header["columns"].items():
+            try:
+                typecode = str(spec["type"])
+                start = data_start + int(spec["offset"])
+                end = start + int(spec["length"]) * array(typecode).itemsize
+            except (KeyError, TypeError, ValueError) as error:
+                raise ValueError(f"Ungueltige Spalte {name} in {self.path}: {error}") from error
+            if end > len(self._map):
+                raise ValueError(f"Datei unvollstaendig: {self.path}")
+            raw = self._view[start:end]
+            if sys.byteorder == "little":
+                self.columns[name] = raw.cast(typecode)
+            else:
+                column = array(typecode, bytes(raw))
+                column.byteswap()
+                self.columns[name] = column
+            # Zwischen-View sofort freigeben, sonst blockiert sie das Schliessen des Mappings
+            raw.release()
+
+    def __enter__(self) -> "ColumnFile":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for column in self.columns.values():
+            if isinstance(column, memoryview):
+                column.release()
+        self.columns = {}
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if not self._map.closed:
+            self._map.close()
+        self._handle.close()
+
+
+def align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _pad(handle) -> None:
+    handle.write(b"\0" * (align(handle.tell()) - handle.tell()))
@@ -1,18 +1,37 @@
 ﻿from __future__ import annotations
 
 import argparse
+import os
 import threading
+import time
+from collections import Counter
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 from pathlib import Path
+from typing import Optional
 
 from ai_helper import AIHelpStore, ApiKeyStore, fetch_ai_help
-from requirements_parser import Compendium, load_compendium
+from requirements_parser import REF_RE, Compendium, load_compendia
+from search_index import RequirementIndex, RequirementQuery
+from similarity import SimilarityIndex, format_reused_help, load_or_build_index
+from status_history import StatusHistory
 from status_store import StatusStore, VALID_STATUSES
 
+FILTER_DEBOUNCE_MS = 250
+RESULT_CHUNK_SIZE = 200
+# gemeinsamer Eintrag "kein Filter" fuer Status-, Level- und Rollenauswahl
+ALL_OPTION = "all"
+
 
 class CompendiumApp(tk.Tk):
-    def __init__(self, compendium: Compendium, store: StatusStore, api_key_store: ApiKeyStore, ai_help_store: AIHelpStore):
+    def __init__(
+        self,
+        compendium: Compendium,
+        store: StatusStore,
+        api_key_store: ApiKeyStore,
+        ai_help_store: AIHelpStore,
+        similarity_index: Optional[SimilarityIndex] = None,
+    ):
         super().__init__()
         self.title("IT-Grundschutz Kompendium - Statusuebersicht")
         self.geometry("1200x800")
@@ -21,10 +40,18 @@ class CompendiumApp(tk.Tk):
         self.store = store
         self.api_key_store = api_key_store
         self.ai_help_store = ai_help_store
+        self.similarity_index = similarity_index
         self.current_module = None
         self.current_requirements = []
         self.active_requirement = None
+        self.similar_codes = []
         self._is_fetching_help = False
+        self.requirement_index = RequirementIndex(compendium)
+        self._filter_after_id = None
+        self._query_generation = 0
+        self._query_started = 0.0
+        self._pending_select_code = None
+        self._suppress_filter_events = False
 
         self._build_widgets()
         self._populate_modules()
@@ -68,22 +95,54 @@ class CompendiumApp(tk.Tk):
         header_frame.columnconfigure(0, weight=1)
         ttk.Label(header_frame, text="Anforderungen").grid(row=0, column=0, sticky="w")
 
-        self.status_filter = tk.StringVar(value="all")
+        self.status_filter = tk.StringVar(value=ALL_OPTION)
         ttk.Label(header_frame, text="Statusfilter:").grid(row=0, column=1, sticky="e", padx=(10, 0))
-        filter_values = ["all"] + VALID_STATUSES
+        filter_values = [ALL_OPTION] + VALID_STATUSES
         self.filter_menu = ttk.OptionMenu(
             header_frame,
             self.status_filter,
-            "all",
+            ALL_OPTION,
             *filter_values,
-            command=lambda *_: self._refresh_requirements(),
+            command=lambda *_: self._schedule_filter(),
         )
         self.filter_menu.grid(row=0, column=2, sticky="e")
 
+        # Live-Filter ueber alle Bausteine
+        filter_bar = ttk.Frame(req_frame)
+        filter_bar.grid(row=1, column=0, sticky="we", pady=(5, 5))
+        filter_bar.columnconfigure(1, weight=1)
+        ttk.Label(filter_bar, text="Suche:").grid(row=0, column=0, sticky="w")
+        self.filter_text = tk.StringVar()
+        ttk.Entry(filter_bar, textvariable=self.filter_text).grid(row=0, column=1, sticky="we", padx=(5, 10))
+        ttk.Label(filter_bar, text="Level:").grid(row=0, column=2, sticky="e")
+        self.level_filter = tk.StringVar(value=ALL_OPTION)
+        ttk.Combobox(
+            filter_bar,
+            textvariable=self.level_filter,
+            values=[ALL_OPTION] + self.requirement_index.levels,
+            state="readonly",
+            width=6,
+        ).grid(row=0, column=3, sticky="e", padx=(5, 10))
+        ttk.Label(filter_bar, text="Rolle:").grid(row=0, column=4, sticky="e")
+        self.role_filter = tk.StringVar(value=ALL_OPTION)
+        ttk.Combobox(
+            filter_bar,
+            textvariable=self.role_filter,
+            values=[ALL_OPTION] + self.requirement_index.roles,
+            state="readonly",
+            width=25,
+        ).grid(row=0, column=5, sticky="e", padx=(5, 10))
+        self.all_modules = tk.BooleanVar(value=False)
+        ttk.Checkbutton(filter_bar, text="Alle Bausteine", variable=self.all_modules).grid(row=0, column=6, sticky="e")
+        for variable in (self.filter_text, self.level_filter, self.role_filter, self.all_modules):
+            variable.trace_add("write", lambda *_: self._schedule_filter())
+
         self.requirements_list = tk.Listbox(req_frame, height=10, exportselection=False)
-        self.requirements_list.grid(row=1, column=0, sticky="nsew", pady=(0, 10))
+        self.requirements_list.grid(row=2, column=0, sticky="nsew")
         self.requirements_list.bind("<<ListboxSelect>>", self._on_requirement_select)
-        req_frame.rowconfigure(1, weight=1)
+        self.filter_info = ttk.Label(req_frame, text="")
+        self.filter_info.grid(row=3, column=0, sticky="w", pady=(0, 10))
+        req_frame.rowconfigure(2, weight=1)
 
         detail_frame = ttk.Frame(paned_right, padding=(0, 5, 0, 0))
         detail_frame.columnconfigure(0, weight=1)
@@ -113,7 +172,13 @@ class CompendiumApp(tk.Tk):
         desc_frame.columnconfigure(0, weight=1)
         ttk.Label(desc_frame, text="Beschreibung").grid(row=0, column=0, sticky="w")
         self.description_text = tk.Text(desc_frame, wrap="word", height=10)
-        self.description_text.grid(row=1, column=0, sticky="nsew", pady=(0, 10))
+        self.description_text.grid(row=1, column=0, sticky="nsew", pady=(0, 5))
+        self.description_text.tag_configure("ref", foreground="blue", underline=True)
+        self.description_text.tag_bind("ref", "<Button-1>", self._on_reference_click)
+        self.description_text.tag_bind("ref", "<Enter>", lambda _: self.description_text.configure(cursor="hand2"))
+        self.description_text.tag_bind("ref", "<Leave>", lambda _: self.description_text.configure(cursor=""))
+        self.references_label = ttk.Label(desc_frame, text="")
+        self.references_label.grid(row=2, column=0, sticky="w", pady=(0, 10))
         desc_frame.rowconfigure(1, weight=1)
 
         hints_frame = ttk.Frame(paned_detail)
@@ -125,8 +190,20 @@ class CompendiumApp(tk.Tk):
         self.ai_button.grid(row=2, column=0, sticky="w", pady=(5, 0))
         hints_frame.rowconfigure(1, weight=1)
 
+        similar_frame = ttk.Frame(paned_detail)
+        similar_frame.columnconfigure(0, weight=1)
+        ttk.Label(similar_frame, text="Aehnliche Anforderungen").grid(row=0, column=0, sticky="w")
+        self.similar_list = tk.Listbox(similar_frame, height=5, exportselection=False)
+        self.similar_list.grid(row=1, column=0, sticky="nsew")
+        self.similar_list.bind("<Double-Button-1>", self._on_similar_activate)
+        self.reuse_button = ttk.Button(similar_frame, text="Hilfe uebernehmen", command=self._reuse_similar_help)
+        self.reuse_button.grid(row=2, column=0, sticky="w", pady=(5, 0))
+        self.reuse_button.state(["disabled"])
+        similar_frame.rowconfigure(1, weight=1)
+
         paned_detail.add(desc_frame, weight=2)
         paned_detail.add(hints_frame, weight=1)
+        paned_detail.add(similar_frame, weight=1)
 
         for widget in [self.description_text, self.ai_help_text]:
             widget.configure(state="disabled")
@@ -146,30 +223,99 @@ class CompendiumApp(tk.Tk):
         index = selection[0]
         module = list(self.compendium.modules.values())[index]
         self.current_module = module
+        self._suppress_filter_events = True
+        self.all_modules.set(False)
+        self._suppress_filter_events = False
         self._populate_requirements(module)
 
-    def _refresh_requirements(self) -> None:
-        self.requirements_list.delete(0, tk.END)
-        if not self.current_module:
+    def _schedule_filter(self) -> None:
+        if self._suppress_filter_events:
             return
-        self.current_requirements = self.current_module.requirements
-        selected_filter = self.status_filter.get()
-        filtered_requirements = []
-        for req in self.current_module.requirements:
-            status = self.store.get_status(req.code) or "open"
-            if selected_filter != "all" and status != selected_filter:
-                continue
-            filtered_requirements.append(req)
-            display = f"{req.code} [{status}] {req.title}"
-            self.requirements_list.insert(tk.END, display)
-        self.current_requirements = filtered_requirements
+        if self._filter_after_id is not None:
+            self.after_cancel(self._filter_after_id)
+        self._query_started = time.perf_counter()
+        self._filter_after_id = self.after(FILTER_DEBOUNCE_MS, self._refresh_requirements)
+
+    def _current_query(self) -> RequirementQuery:
+        level = self.level_filter.get()
+        role = self.role_filter.get()
+        status = self.status_filter.get()
+        use_module = self.current_module is not None and not self.all_modules.get()
+        return RequirementQuery(
+            text=self.filter_text.get().strip(),
+            level="" if level == ALL_OPTION else level,
+            role="" if role == ALL_OPTION else role,
+            status="all" if status == ALL_OPTION else status,
+            module_code=self.current_module.code if use_module else None,
+        )
 
+    def _refresh_requirements(self, select_code: Optional[str] = None) -> None:
+        """Startet die Filterabfrage im Hintergrund; aeltere, noch laufende Abfragen verfallen."""
+        if self._filter_after_id is not None:
+            self.after_cancel(self._filter_after_id)
+            self._filter_after_id = None
+        query = self._current_query()
+        if not self.all_modules.get() and query == RequirementQuery():
+            # ohne Baustein und ohne Filter bleibt die Liste leer wie bisher
+            self._query_generation += 1
+            self.requirements_list.delete(0, tk.END)
+            self.current_requirements = []
+            self.filter_info.config(text="")
+            return
+        if not self._query_started:
+            self._query_started = time.perf_counter()
+        self._query_generation += 1
+        generation = self._query_generation
+        self._pending_select_code = select_code
+        # Momentaufnahme der Status, damit der Hintergrundthread den Store nicht liest
+        statuses = self.store.status_map()
+        threading.Thread(target=self._filter_thread, args=(generation, query, statuses), daemon=True).start()
+
+    def _filter_thread(self, generation: int, query: RequirementQuery, statuses) -> None:
+        results = self.requirement_index.search(query, statuses, lambda: generation != self._query_generation)
+        if results is not None:
+            self.after(0, lambda: self._apply_filter_results(generation, results, statuses))
+
+    def _apply_filter_results(self, generation: int, results, statuses) -> None:
+        if generation != self._query_generation:
+            return
+        self.requirements_list.delete(0, tk.END)
+        self.current_requirements = results
+        latency_ms = (time.perf_counter() - self._query_started) * 1000
+        self._query_started = 0.0
+        self.filter_info.config(text=f"{len(results)} Treffer ({latency_ms:.0f} ms)")
         # wenn Filter greift und nichts uebrig bleibt -> Details zuruecksetzen
-        if not filtered_requirements:
+        if not results:
             self._clear_details()
+            return
+        self._insert_result_chunk(generation, results, statuses, 0)
+
+    def _insert_result_chunk(self, generation: int, results, statuses, start: int) -> None:
+        if generation != self._query_generation:
+            return
+        end = min(start + RESULT_CHUNK_SIZE, len(results))
+        self.requirements_list.insert(
+            tk.END,
+            *(f"{req.code} [{statuses.get(req.code, 'open')}] {req.title}" for req in results[start:end]),
+        )
+        if end < len(results):
+            self.after(1, lambda: self._insert_result_chunk(generation, results, statuses, end))
+        elif self._pending_select_code:
+            self._select_requirement_row(self._pending_select_code)
+            self._pending_select_code = None
+
+    def _select_requirement_row(self, code: str) -> None:
+        for index, req in enumerate(self.current_requirements):
+            if req.code == code:
+                self.requirements_list.selection_clear(0, tk.END)
+                self.requirements_list.selection_set(index)
+                self.requirements_list.see(index)
+                return
 
     def _populate_requirements(self, module) -> None:
-        self.current_requirements = module.requirements
+        # Liste sofort leeren, damit Klicks nicht auf veraltete Eintraege zeigen
+        self.requirements_list.delete(0, tk.END)
+        self.current_requirements = []
         self._refresh_requirements()
         self._clear_details()
 
@@ -193,9 +339,102 @@ class CompendiumApp(tk.Tk):
 
         desc = req.description or "Keine Beschreibung gefunden."
         self._set_text(self.description_text, desc)
+        self._highlight_references(req)
         help_text = self.ai_help_store.get_help(req.code)
         self._update_ai_text(help_text)
         self.ai_button.state(["!disabled"])
+        self._populate_similar(req)
+
+    def _highlight_references(self, req) -> None:
+        for match in REF_RE.finditer(req.description):
+            code = match.group("code")
+            if code == req.code or (code not in self.compendium.requirements and code not in self.compendium.modules):
+                continue
+            self.description_text.tag_add("ref", f"1.0+{match.start()}c", f"1.0+{match.end()}c")
+
+        referenced = self.compendium.referenced_requirements(req.code)
+        if not referenced:
+            self.references_label.config(text="Keine Querverweise.")
+            return
+        counts = Counter(self.store.get_status(other.code) or "open" for other in referenced)
+        pending = counts["open"] + counts["in_progress"]
+        self.references_label.config(
+            text=f"Querverweise: {pending} von {len(referenced)} verwiesenen Anforderungen noch offen."
+        )
+
+    def _on_reference_click(self, event) -> None:
+        index = self.description_text.index(f"@{event.x},{event.y}")
+        ref_range = self.description_text.tag_prevrange("ref", f"{index}+1c")
+        if ref_range:
+            self._navigate_to(self.description_text.get(*ref_range))
+
+    def _on_similar_activate(self, event=None) -> None:
+        selection = self.similar_list.curselection()
+        if selection:
+            self._navigate_to(self.similar_codes[selection[0]][0])
+
+    def _navigate_to(self, code: str) -> None:
+        req = self.compendium.get_requirement(code)
+        module_code = req.module_code if req else code
+        module_codes = list(self.compendium.modules)
+        if module_code not in module_codes:
+            return
+        module_index = module_codes.index(module_code)
+        self.module_list.selection_clear(0, tk.END)
+        self.module_list.selection_set(module_index)
+        self.module_list.see(module_index)
+        self.current_module = self.compendium.modules[module_code]
+        self._suppress_filter_events = True
+        self.status_filter.set(ALL_OPTION)
+        self.filter_text.set("")
+        self.level_filter.set(ALL_OPTION)
+        self.role_filter.set(ALL_OPTION)
+        self.all_modules.set(False)
+        self._suppress_filter_events = False
+        self.current_requirements = []
+        self._clear_details()
+        self._refresh_requirements(select_code=req.code if req else None)
+        if req is not None:
+            self._display_requirement(req)
+
+    def _populate_similar(self, req) -> None:
+        self.similar_list.delete(0, tk.END)
+        self.similar_codes = []
+        if self.similarity_index is None:
+            self.reuse_button.state(["disabled"])
+            return
+        for code, score in self.similarity_index.neighbours(req.code, 5):
+            other = self.compendium.get_requirement(code)
+            title = other.title if other else "Unbekannte Anforderung"
+            status = self.store.get_status(code) or "open"
+            help_flag = " (KI-Hilfe)" if self.ai_help_store.get_help(code) else ""
+            self.similar_list.insert(tk.END, f"{score:.2f} {code} [{status}] {title}{help_flag}")
+            self.similar_codes.append((code, score))
+        if self.similar_codes:
+            self.reuse_button.state(["!disabled"])
+        else:
+            self.reuse_button.state(["disabled"])
+
+    def _reuse_similar_help(self) -> None:
+        if not self.active_requirement:
+            return
+        selection = self.similar_list.curselection()
+        if not selection:
+            messagebox.showinfo("Hinweis", "Bitte eine aehnliche Anforderung auswaehlen.")
+            return
+        code, score = self.similar_codes[selection[0]]
+        content = self.ai_help_store.get_help(code)
+        if not content:
+            messagebox.showinfo("KI Hilfe", f"Fuer {code} ist keine KI-Hilfe gespeichert.")
+            return
+        existing = self.ai_help_store.get_help(self.active_requirement.code)
+        if existing and not messagebox.askyesno(
+            "KI Hilfe", f"Fuer {self.active_requirement.code} ist bereits eine KI-Hilfe gespeichert. Ueberschreiben?"
+        ):
+            return
+        reused = format_reused_help(code, score, content)
+        self.ai_help_store.save_help(self.active_requirement.code, reused)
+        self._update_ai_text(reused)
 
     def _set_text(self, widget: tk.Text, value: str) -> None:
         widget.configure(state="normal")
@@ -218,10 +457,7 @@ class CompendiumApp(tk.Tk):
         self.store.set_status(req.code, status, note_value)
         self.store.save()
         self._populate_modules()
-        if self.current_module:
-            self._refresh_requirements()
-            if self.requirements_list.size() > 0:
-                self.requirements_list.selection_set(min(selection[0], self.requirements_list.size() - 1))
+        self._refresh_requirements(select_code=req.code)
         messagebox.showinfo("Gespeichert", f"Status fuer {req.code} gespeichert.")
 
     def _prompt_api_key(self) -> None:
@@ -278,24 +514,34 @@ class CompendiumApp(tk.Tk):
         self.active_requirement = None
         for widget in [self.description_text, self.ai_help_text]:
             self._set_text(widget, "")
+        self.references_label.config(text="")
         self.ai_button.state(["disabled"])
+        self.similar_list.delete(0, tk.END)
+        self.similar_codes = []
+        self.reuse_button.state(["disabled"])
 
 def parse_args():
     parser = argparse.ArgumentParser(description="GUI fuer das IT-Grundschutz-Kompendium.")
-    parser.add_argument("--xml", default="XML_Kompendium_2023.xml", help="Pfad zur XML-Datei.")
+    parser.add_argument("--xml", action="append", help="Pfad zur XML-Datei (mehrfach moeglich).")
+    parser.add_argument("--jobs", type=int, default=1, help="Parallele Prozesse beim Parsen (0 = alle CPU-Kerne).")
     parser.add_argument("--status-file", default="status.json", help="Pfad zur Status-Datei.")
+    parser.add_argument("--history-file", default="status_history.jsonl", help="Pfad zum Aenderungsprotokoll.")
+    parser.add_argument("--user", help="Benutzername fuer das Aenderungsprotokoll.")
     parser.add_argument("--api-key-file", default="openai_key.txt", help="Pfad zur Datei mit OpenAI-API-Key.")
     parser.add_argument("--ai-help-file", default="ai_help_store.json", help="Pfad zur Datei fuer KI-Hilfen.")
+    parser.add_argument("--similarity-file", default="similarity_index.bin", help="Pfad zum Aehnlichkeitsindex.")
     return parser.parse_args()
 
 
 def main():
     args = parse_args()
-    compendium = load_compendium(Path(args.xml))
-    store = StatusStore(Path(args.status_file))
+    xml_paths = [Path(path) for path in args.xml or ["XML_Kompendium_2023.xml"]]
+    compendium = load_compendia(xml_paths, args.jobs or os.cpu_count() or 1)
+    store = StatusStore(Path(args.status_file), StatusHistory(Path(args.history_file)), args.user)
     api_key_store = ApiKeyStore(Path(args.api_key_file))
     ai_help_store = AIHelpStore(Path(args.ai_help_file))
-    app = CompendiumApp(compendium, store, api_key_store, ai_help_store)
+    similarity_index = load_or_build_index(compendium, Path(args.similarity_file))
+    app = CompendiumApp(compendium, store, api_key_store, ai_help_store, similarity_index)
     app.mainloop()
 
 
@@ -0,0 +1,205 @@
+﻿from __future__ import annotations
+
+import json
+from array import array
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from column_file import ColumnFile, write_column_file
+from requirements_parser import Compendium, Module, Requirement
+
+MODEL_MAGIC = b"BSIKMOD1"
+MODEL_FORMAT = "bsi-kompendium-model"
+MODEL_VERSION = 1
+LEVELS = "BSEH"
+
+
+class _StringTable:
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def add(self, value: str) -> int:
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.values)
+            self.ids[value] = string_id
+            self.values.append(value)
+        return string_id
+
+
+def export_model(compendium: Compendium, path: Path) -> None:
+    """Schreibt Bausteine und Anforderungen spaltenweise in eine Binaerdatei.
+
+    Rahmenformat siehe ``column_file.write_column_file`` (Kennung ``MODEL_MAGIC``).
+    Anforderungen sind nach Code sortiert, sodass Leser per Binaersuche zugreifen koennen.
+    """
+    strings = _StringTable()
+    modules = list(compendium.modules.values())
+    module_positions = {module.code: position for position, module in enumerate(modules)}
+    requirements = [compendium.requirements[code] for code in sorted(compendium.requirements)]
+
+    columns: Dict[str, array] = {
+        "module_code": array("I", (strings.add(module.code) for module in modules)),
+        "module_title": array("I", (strings.add(module.title) for module in modules)),
+        "module_chapter": array("I", (strings.add(module.chapter) for module in modules)),
+        "requirement_code": array("I", (strings.add(req.code) for req in requirements)),
+        "requirement_title": array("I", (strings.add(req.title) for req in requirements)),
+        "requirement_level": array("B", (LEVELS.index(req.level) for req in requirements)),
+        "requirement_module": array("I", (module_positions[req.module_code] for req in requirements)),
+    }
+    columns["role_offsets"], columns["role_ids"] = _ragged(requirements, lambda req: req.roles, strings)
+    # wie geparst (inkl. unbekannter Codes); Leser filtern bei Bedarf selbst
+    columns["reference_offsets"], columns["reference_ids"] = _ragged(requirements, lambda req: req.references, strings)
+    columns["string_offsets"], columns["string_blob"] = _blob(strings.values)
+    columns["description_offsets"], columns["description_blob"] = _blob(req.description for req in requirements)
+
+    header = {
+        "format": MODEL_FORMAT,
+        "version": MODEL_VERSION,
+        "levels": LEVELS,
+        "counts": {"modules": len(modules), "requirements": len(requirements), "strings": len(strings.values)},
+    }
+    write_column_file(path, MODEL_MAGIC, header, columns)
+
+
+def export_jsonl(compendium: Compendium, path: Path) -> None:
+    """JSON-Lines-Variante: eine Kopfzeile, dann je Baustein und Anforderung ein Objekt."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as handle:
+        meta = {"type": "meta", "format": MODEL_FORMAT, "version": MODEL_VERSION}
+        handle.write(json.dumps(meta, ensure_ascii=False) + "\n")
+        for module in compendium.modules.values():
+            record = {
+                "type": "module",
+                "code": module.code,
+                "title": module.title,
+                "chapter": module.chapter,
+                "requirements": [req.code for req in module.requirements],
+            }
+            handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+        for code in sorted(compendium.requirements):
+            record = {"type": "requirement", **asdict(compendium.requirements[code])}
+            handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class CompendiumModel:
+    """Leser fuer ``export_model``-Dateien mit wahlfreiem Zugriff ueber ``mmap``.
+
+    Spalten werden als ``memoryview`` direkt auf die gemappte Datei gelegt, Zeichenketten
+    erst beim Zugriff dekodiert.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = ColumnFile(path, MODEL_MAGIC)
+        self.header = self._file.header
+        if self.header.get("format") != MODEL_FORMAT or self.header.get("version") != MODEL_VERSION:
+            self._file.close()
+            raise ValueError(f"Nicht unterstuetzte Modellversion: {self.header.get('version')}")
+        self._columns = self._file.columns
+        self.levels = self.header["levels"]
+
+    def __enter__(self) -> "CompendiumModel":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._columns = None
+        self._file.close()
+
+    def __len__(self) -> int:
+        return len(self._columns["requirement_code"])
+
+    def string(self, string_id: int) -> str:
+        offsets = self._columns["string_offsets"]
+        return bytes(self._columns["string_blob"][offsets[string_id] : offsets[string_id + 1]]).decode("utf-8")
+
+    def requirement_codes(self) -> Iterator[str]:
+        for string_id in self._columns["requirement_code"]:
+            yield self.string(string_id)
+
+    def find(self, code: str) -> Optional[int]:
+        """Position einer Anforderung per Binaersuche ueber die sortierte Code-Spalte."""
+        target = code.encode("utf-8")
+        codes = self._columns["requirement_code"]
+        offsets = self._columns["string_offsets"]
+        blob = self._columns["string_blob"]
+        low, high = 0, len(codes)
+        while low < high:
+            middle = (low + high) // 2
+            string_id = codes[middle]
+            candidate = bytes(blob[offsets[string_id] : offsets[string_id + 1]])
+            if candidate < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(codes) and self.string(codes[low]) == code:
+            return low
+        return None
+
+    def get_requirement(self, code: str) -> Optional[Requirement]:
+        position = self.find(code)
+        if position is None:
+            return None
+        return self.requirement_at(position)
+
+    def requirement_at(self, position: int) -> Requirement:
+        columns = self._columns
+        module_position = columns["requirement_module"][position]
+        description_offsets = columns["description_offsets"]
+        description = bytes(
+            columns["description_blob"][description_offsets[position] : description_offsets[position + 1]]
+        ).decode("utf-8")
+        return Requirement(
+            code=self.string(columns["requirement_code"][position]),
+            title=self.string(columns["requirement_title"][position]),
+            level=self.levels[columns["requirement_level"][position]],
+            roles=self._ragged_strings("role", position),
+            description=description,
+            module_code=self.string(columns["module_code"][module_position]),
+            module_title=self.string(columns["module_title"][module_position]),
+            chapter=self.string(columns["module_chapter"][module_position]),
+            references=self._ragged_strings("reference", position),
+        )
+
+    def modules(self) -> List[Module]:
+        columns = self._columns
+        return [
+            Module(
+                code=self.string(columns["module_code"][position]),
+                title=self.string(columns["module_title"][position]),
+                chapter=self.string(columns["module_chapter"][position]),
+            )
+            for position in range(len(columns["module_code"]))
+        ]
+
+    def _ragged_strings(self, prefix: str, position: int) -> List[str]:
+        offsets = self._columns[f"{prefix}_offsets"]
+        ids = self._columns[f"{prefix}_ids"]
+        return [self.string(string_id) for string_id in ids[offsets[position] : offsets[position + 1]]]
+
+
+def _ragged(
+    requirements: List[Requirement],
+    values: Callable[[Requirement], List[str]],
+    strings: _StringTable,
+) -> Tuple[array, array]:
+    offsets = array("I", [0])
+    ids = array("I")
+    for req in requirements:
+        ids.extend(strings.add(value) for value in values(req))
+        offsets.append(len(ids))
+    return offsets, ids
+
+
+def _blob(values: Iterable[str]) -> Tuple[array, array]:
+    offsets = array("I", [0])
+    blob = bytearray()
+    for value in values:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, array("B", bytes(blob))
@@ -1,12 +1,14 @@
 ﻿from __future__ import annotations
 
+import heapq
 import re
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
-from text_utils import normalize_text
+from text_utils import TextNormalizer
 
 DOCBOOK_NS = {"d": "http://docbook.org/ns/docbook"}
 
@@ -16,6 +18,8 @@ REQ_RE = re.compile(
     r"\s+(?P<title>.+?)\s*\((?P<level>[BSEH])\)"
     r"(?:\s*\[(?P<roles>[^\]]+)\])?$"
 )
+# Verweise im Fliesstext ("siehe OPS.1.1.3", "APP.1.1.A3") im Format von MODULE_RE/REQ_RE
+REF_RE = re.compile(r"\b(?P<code>[A-Z]{3,4}\.\d+(?:\.\d+)*(?:\.A\d+)?)\b")
 
 
 @dataclass
@@ -28,6 +32,7 @@ class Requirement:
     module_code: str
     module_title: str
     chapter: str
+    references: List[str] = field(default_factory=list)
 
 
 @dataclass
@@ -38,10 +43,26 @@ class Module:
     requirements: List[Requirement] = field(default_factory=list)
 
 
+@dataclass
+class CodeConflict:
+    code: str
+    kept_source: str
+    ignored_source: str
+
+
 @dataclass
 class Compendium:
     modules: Dict[str, Module]
     requirements: Dict[str, Requirement]
+    # Herkunftsdatei je Baustein- und Anforderungscode
+    sources: Dict[str, str] = field(default_factory=dict)
+    conflicts: List[CodeConflict] = field(default_factory=list)
+    # Verweise Anforderung -> Baustein/Anforderung und umgekehrt, nur auf bekannte Codes
+    references: Dict[str, List[str]] = field(default_factory=dict)
+    referenced_by: Dict[str, List[str]] = field(default_factory=dict)
+    _traversal_cache: Dict[Tuple[str, bool, Optional[int]], Dict[str, int]] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
 
     def get_module(self, code: str) -> Optional[Module]:
         return self.modules.get(code)
@@ -49,74 +70,319 @@ class Compendium:
     def get_requirement(self, code: str) -> Optional[Requirement]:
         return self.requirements.get(code)
 
+    def build_reference_index(self) -> None:
+        self.references = {}
+        self.referenced_by = {}
+        self._traversal_cache.clear()
+        for req in self.requirements.values():
+            targets = [code for code in req.references if code in self.requirements or code in self.modules]
+            if not targets:
+                continue
+            self.references[req.code] = targets
+            for target in targets:
+                self.referenced_by.setdefault(target, []).append(req.code)
+        for sources in self.referenced_by.values():
+            sources.sort()
+
+    def resolve_references(self, code: str, reverse: bool = False, depth: Optional[int] = None) -> Dict[str, int]:
+        """Liefert alle transitiv (bzw. mit ``reverse`` eingehend) verwiesenen Codes mit Abstand.
+
+        Ein Baustein verweist auf alles, worauf eine seiner Anforderungen verweist. Ergebnisse
+        werden je (Code, Richtung, Tiefe) zwischengespeichert.
+        """
+        key = (code, reverse, depth)
+        cached = self._traversal_cache.get(key)
+        if cached is not None:
+            return cached
+        excluded = self._own_codes(code)
+        distances: Dict[str, int] = {}
+        frontier = [code]
+        level = 0
+        while frontier and (depth is None or level < depth):
+            level += 1
+            next_frontier = []
+            for current in frontier:
+                for target in self._adjacent(current, reverse):
+                    if target not in excluded and target not in distances:
+                        distances[target] = level
+                        next_frontier.append(target)
+            frontier = next_frontier
+        self._traversal_cache[key] = distances
+        return distances
+
+    def referenced_requirements(
+        self, code: str, reverse: bool = False, depth: Optional[int] = None
+    ) -> List[Requirement]:
+        """Anforderungen hinter ``resolve_references``; Bausteine werden zu ihren Anforderungen aufgeloest."""
+        excluded = self._own_codes(code)
+        result: Dict[str, Requirement] = {}
+        for target in self.resolve_references(code, reverse, depth):
+            module = self.modules.get(target)
+            candidates = module.requirements if module else [self.requirements[target]]
+            for req in candidates:
+                if req.code not in excluded:
+                    result[req.code] = req
+        return [result[req_code] for req_code in sorted(result)]
+
+    def _own_codes(self, code: str) -> Set[str]:
+        module = self.modules.get(code)
+        if module is None:
+            return {code}
+        return {code, *(req.code for req in module.requirements)}
 
-def load_compendium(xml_path: Path) -> Compendium:
-    xml_path = xml_path.expanduser().resolve()
-    if not xml_path.exists():
-        raise FileNotFoundError(f"XML-Datei nicht gefunden: {xml_path}")
+    def _adjacent(self, code: str, reverse: bool) -> List[str]:
+        edges = self.referenced_by if reverse else self.references
+        module = self.modules.get(code)
+        if module is None:
+            return edges.get(code, [])
+        targets = list(edges.get(code, []))
+        for req in module.requirements:
+            targets.extend(edges.get(req.code, []))
+        return targets
+
+
+def load_compendium(xml_path: Path, jobs: int = 1) -> Compendium:
+    return load_compendia([xml_path], jobs)
+
+
+def load_compendia(xml_paths: Sequence[Path], jobs: int = 1) -> Compendium:
+    """Laedt mehrere DocBook-Dateien (Kompendium-Editionen, eigene Bausteine) in ein Kompendium.
+
+    Mit ``jobs > 1`` werden Dateien und innerhalb einer Datei die Kapitel in einem
+    Prozesspool geparst. Bei doppelten Codes gewinnt die zuerst genannte Datei; die
+    uebrigen Vorkommen landen in ``Compendium.conflicts``.
+    """
+    paths = []
+    for xml_path in xml_paths:
+        xml_path = xml_path.expanduser().resolve()
+        if not xml_path.exists():
+            raise FileNotFoundError(f"XML-Datei nicht gefunden: {xml_path}")
+        paths.append(str(xml_path))
+    if not paths:
+        raise ValueError("Keine XML-Datei angegeben.")
+
+    jobs = max(1, jobs)
+    if jobs == 1:
+        parsed = [_parse_root(ET.parse(path).getroot()) for path in paths]
+    elif len(paths) >= jobs:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            parsed = list(pool.map(_parse_file, paths))
+    else:
+        # Liegen weniger Dateien als Prozesse vor, wird jede Datei einmal im Elternprozess in
+        # Kapitel zerlegt; die Prozesse erhalten nach Groesse ausgeglichene Kapitelgruppen.
+        parts = -(-jobs // len(paths))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = []
+            for path in paths:
+                split = split_chapters(path)
+                if not split.chapters:
+                    # z. B. UTF-16 oder ungewoehnliche Auszeichnung: Textsuche findet keine Kapitel,
+                    # die Datei wird dann als Ganzes geparst, damit das Ergebnis nicht von jobs abhaengt
+                    futures.append([pool.submit(_parse_file, path)])
+                    continue
+                groups = _balance(split.chapters, parts)
+                futures.append([pool.submit(_parse_chapter_group, path, split, group) for group in groups])
+            parsed = [
+                sorted((chapter for future in file_futures for chapter in future.result()), key=lambda c: c.index)
+                for file_futures in futures
+            ]
+    return _merge_chapters(paths, parsed)
+
+
+@dataclass
+class ChapterSplit:
+    """Byte-Bereiche der Kapitel einer DocBook-Datei.
+
+    Alles vor dem ersten Kapitel (Prolog, Wurzelelement, Vorspann) und ab ``trailer_start``
+    (schliessendes Wurzelelement) wird jeder Kapitelgruppe mitgegeben, sodass sie als
+    eigenstaendiges Dokument geparst werden kann. ``chapters`` enthaelt Tupel (Index, Start, Ende).
+    """
+
+    preamble_end: int
+    trailer_start: int
+    chapters: List[Tuple[int, int, int]] = field(default_factory=list)
 
-    tree = ET.parse(str(xml_path))
-    root = tree.getroot()
-    modules: Dict[str, Module] = {}
-    requirements: Dict[str, Requirement] = {}
 
-    for chapter in root.findall("d:chapter", DOCBOOK_NS):
+# Kapitel-Tags; Kommentare, CDATA und Verarbeitungsanweisungen werden mitgefunden und uebersprungen
+CHAPTER_TAG_RE = re.compile(
+    rb"<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|<(?P<end>/?)(?:[\w.-]+:)?chapter(?=[\s/>])[^>]*?(?P<empty>/?)>",
+    re.DOTALL,
+)
+
+
+def split_chapters(path: str) -> ChapterSplit:
+    """Ermittelt die Kapitelgrenzen per Textsuche, ohne die Datei zu parsen.
+
+    Wie im Kompendium werden Kapitel als direkte Kinder des Wurzelelements erwartet.
+    """
+    data = Path(path).read_bytes()
+    chapters: List[Tuple[int, int, int]] = []
+    depth = 0
+    start = 0
+    for match in CHAPTER_TAG_RE.finditer(data):
+        if match.group("end") is None:
+            continue
+        if match.group("end"):
+            depth -= 1
+            if depth == 0:
+                chapters.append((len(chapters), start, match.end()))
+        elif match.group("empty"):
+            if depth == 0:
+                chapters.append((len(chapters), match.start(), match.end()))
+        else:
+            if depth == 0:
+                start = match.start()
+            depth += 1
+    if not chapters:
+        return ChapterSplit(preamble_end=len(data), trailer_start=len(data))
+    return ChapterSplit(preamble_end=chapters[0][1], trailer_start=chapters[-1][2], chapters=chapters)
+
+
+def _balance(chapters: List[Tuple[int, int, int]], parts: int) -> List[List[Tuple[int, int, int]]]:
+    # groesste Kapitel zuerst jeweils der aktuell kleinsten Gruppe zuordnen
+    heap = [(0, group) for group in range(min(parts, len(chapters)))]
+    groups: List[List[Tuple[int, int, int]]] = [[] for _ in heap]
+    for chapter in sorted(chapters, key=lambda item: item[2] - item[1], reverse=True):
+        size, group = heapq.heappop(heap)
+        groups[group].append(chapter)
+        heapq.heappush(heap, (size + chapter[2] - chapter[1], group))
+    return [sorted(group) for group in groups]
+
+
+@dataclass
+class ParsedChapter:
+    """Kompaktes, picklebares Ergebnis eines Kapitels.
+
+    ``modules`` enthaelt Tupel (Code, Titel, Kapitel), ``requirements`` Tupel
+    (Code, Titel, Level, Rollen, Beschreibung, Bausteincode, Verweise).
+    """
+
+    index: int
+    modules: List[Tuple[str, str, str]] = field(default_factory=list)
+    requirements: List[Tuple[str, str, str, Tuple[str, ...], str, str, Tuple[str, ...]]] = field(default_factory=list)
+
+
+def _parse_file(path: str) -> List[ParsedChapter]:
+    return _parse_root(ET.parse(path).getroot())
+
+
+def _parse_chapter_group(path: str, split: ChapterSplit, chapters: List[Tuple[int, int, int]]) -> List[ParsedChapter]:
+    # nur Vorspann, eigene Kapitel und Abschluss lesen und als verkuerztes Dokument parsen
+    with open(path, "rb") as handle:
+        fragments = [handle.read(split.preamble_end)]
+        for _, start, end in chapters:
+            handle.seek(start)
+            fragments.append(handle.read(end - start))
+        handle.seek(split.trailer_start)
+        fragments.append(handle.read())
+    root = ET.fromstring(b"".join(fragments))
+    return _parse_root(root, [index for index, _, _ in chapters])
+
+
+def _parse_root(root: ET.Element, indices: Optional[List[int]] = None) -> List[ParsedChapter]:
+    normalize = TextNormalizer()
+    result = []
+    for position, chapter in enumerate(root.findall("d:chapter", DOCBOOK_NS)):
+        parsed = ParsedChapter(index=indices[position] if indices is not None else position)
+        # einmal je Kapitel pruefen, ob dort ueberhaupt Mojibake vorkommen kann
+        normalize.scan("".join(chapter.itertext()))
         chapter_title_raw = _text_or_default(chapter.find("d:title", DOCBOOK_NS), "Unbenanntes Kapitel")
-        chapter_title = normalize_text(chapter_title_raw)
+        chapter_title = normalize(chapter_title_raw)
         for section in chapter.findall("d:section", DOCBOOK_NS):
-            _walk_section(section, chapter_title, modules, requirements, current_module=None)
+            _walk_section(section, chapter_title, parsed, normalize, current_module=None)
+        result.append(parsed)
+    return result
+
+
+def _merge_chapters(paths: List[str], parsed: List[List[ParsedChapter]]) -> Compendium:
+    modules: Dict[str, Module] = {}
+    requirements: Dict[str, Requirement] = {}
+    sources: Dict[str, str] = {}
+    conflicts: List[CodeConflict] = []
+
+    for source, chapters in zip(paths, parsed):
+        for chapter in chapters:
+            for module_code, module_title, chapter_title in chapter.modules:
+                if module_code not in modules:
+                    modules[module_code] = Module(code=module_code, title=module_title, chapter=chapter_title)
+                    sources[module_code] = source
+                elif sources[module_code] != source:
+                    # neue Anforderungen des doppelten Bausteins werden dem ersten zugeordnet
+                    conflicts.append(CodeConflict(module_code, sources[module_code], source))
+            for req_code, title, level, roles, description, module_code, references in chapter.requirements:
+                if req_code in requirements:
+                    conflicts.append(CodeConflict(req_code, sources[req_code], source))
+                    continue
+                module = modules[module_code]
+                requirement = Requirement(
+                    code=req_code,
+                    title=title,
+                    level=level,
+                    roles=list(roles),
+                    description=description,
+                    module_code=module.code,
+                    module_title=module.title,
+                    chapter=module.chapter,
+                    references=list(references),
+                )
+                requirements[req_code] = requirement
+                sources[req_code] = source
+                module.requirements.append(requirement)
 
     # sort requirements inside modules for stable CLI output
     for module in modules.values():
         module.requirements.sort(key=lambda req: req.code)
 
-    return Compendium(modules=dict(sorted(modules.items())), requirements=requirements)
+    compendium = Compendium(
+        modules=dict(sorted(modules.items())),
+        requirements=requirements,
+        sources=sources,
+        conflicts=conflicts,
+    )
+    compendium.build_reference_index()
+    return compendium
 
 
 def _walk_section(
     section: ET.Element,
     chapter_title: str,
-    modules: Dict[str, Module],
-    requirements: Dict[str, Requirement],
-    current_module: Optional[Module],
+    parsed: ParsedChapter,
+    normalize: TextNormalizer,
+    current_module: Optional[str],
 ) -> None:
     title_text_raw = _text_or_default(section.find("d:title", DOCBOOK_NS), "").strip()
     module_match = MODULE_RE.match(title_text_raw)
-    title_text = normalize_text(title_text_raw)
+    title_text = normalize(title_text_raw)
 
     if module_match:
         module_code = f"{module_match.group('prefix')}.{module_match.group('body')}"
-        module_title = normalize_text(module_match.group("title").strip())
-        module = modules.get(module_code)
-        if module is None:
-            module = Module(code=module_code, title=module_title, chapter=chapter_title)
-            modules[module_code] = module
-        current_module = module
+        module_title = normalize(module_match.group("title").strip())
+        parsed.modules.append((module_code, module_title, chapter_title))
+        current_module = module_code
 
     req_match = REQ_RE.match(title_text)
     if req_match and current_module is not None:
         req_code = req_match.group("code")
-        req_title = normalize_text(req_match.group("title").strip())
+        req_title = normalize(req_match.group("title").strip())
         req_level = req_match.group("level")
-        raw_roles = normalize_text((req_match.group("roles") or "").strip())
+        raw_roles = normalize((req_match.group("roles") or "").strip())
         roles = _split_roles(raw_roles)
-        description = normalize_text(_collect_text(section))
-
-        requirement = Requirement(
-            code=req_code,
-            title=req_title,
-            level=req_level,
-            roles=roles,
-            description=description,
-            module_code=current_module.code,
-            module_title=current_module.title,
-            chapter=current_module.chapter,
+        description_raw, references = _collect_text(section)
+        description = normalize(description_raw)
+        parsed.requirements.append(
+            (
+                req_code,
+                req_title,
+                req_level,
+                tuple(roles),
+                description,
+                current_module,
+                tuple(code for code in references if code != req_code),
+            )
         )
-        requirements[req_code] = requirement
-        current_module.requirements.append(requirement)
 
     for child in section.findall("d:section", DOCBOOK_NS):
-        _walk_section(child, chapter_title, modules, requirements, current_module)
+        _walk_section(child, chapter_title, parsed, normalize, current_module)
 
 
 def _text_or_default(element: Optional[ET.Element], default: str) -> str:
@@ -125,7 +391,7 @@ def _text_or_default(element: Optional[ET.Element], default: str) -> str:
     return "".join(element.itertext())
 
 
-def _collect_text(section: ET.Element) -> str:
+def _collect_text(section: ET.Element) -> Tuple[str, List[str]]:
     relevant_tags = {
         f"{{{DOCBOOK_NS['d']}}}para",
         f"{{{DOCBOOK_NS['d']}}}itemizedlist",
@@ -136,6 +402,7 @@ def _collect_text(section: ET.Element) -> str:
         f"{{{DOCBOOK_NS['d']}}}important",
     }
     chunks: List[str] = []
+    references: Dict[str, None] = {}
     for child in section:
         if child.tag not in relevant_tags:
             continue
@@ -143,7 +410,9 @@ def _collect_text(section: ET.Element) -> str:
         if text:
             text = text.replace("<?linebreak?>", " ").strip()
             chunks.append(text)
-    return "\n\n".join(chunks)
+            for match in REF_RE.finditer(text):
+                references.setdefault(match.group("code"))
+    return "\n\n".join(chunks), list(references)
 
 
 def _split_roles(raw_roles: str) -> List[str]:
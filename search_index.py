@@ -0,0 +1,82 @@
+﻿from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set
+
+from requirements_parser import Compendium, Requirement
+
+# Wie oft die Suche prueft, ob sie durch eine neuere Anfrage ueberholt wurde
+CANCEL_CHECK_INTERVAL = 1024
+
+
+@dataclass(frozen=True)
+class RequirementQuery:
+    text: str = ""
+    level: str = ""
+    role: str = ""
+    status: str = "all"
+    module_code: Optional[str] = None
+
+
+class RequirementIndex:
+    """Vorberechnete Filterindizes ueber alle Anforderungen eines Kompendiums.
+
+    Anforderungen liegen in Baustein-Reihenfolge vor, sodass jeder Baustein ein
+    zusammenhaengender Bereich ist. Level- und Rollenfilter sind Mengen von Positionen,
+    der Freitext wird gegen vorab kleingeschriebene Texte (Code, Titel, Beschreibung) geprueft.
+    """
+
+    def __init__(self, compendium: Compendium):
+        self.requirements: List[Requirement] = []
+        self._module_ranges: Dict[str, range] = {}
+        self._by_level: Dict[str, Set[int]] = {}
+        self._by_role: Dict[str, Set[int]] = {}
+        for module in compendium.modules.values():
+            start = len(self.requirements)
+            self.requirements.extend(module.requirements)
+            self._module_ranges[module.code] = range(start, len(self.requirements))
+        self._haystacks = [f"{req.code} {req.title} {req.description}".lower() for req in self.requirements]
+        for position, req in enumerate(self.requirements):
+            self._by_level.setdefault(req.level, set()).add(position)
+            for role in req.roles:
+                self._by_role.setdefault(role, set()).add(position)
+        self.levels = sorted(self._by_level)
+        self.roles = sorted(self._by_role, key=str.lower)
+
+    def search(
+        self,
+        query: RequirementQuery,
+        statuses: Dict[str, str],
+        cancelled: Optional[Callable[[], bool]] = None,
+    ) -> Optional[List[Requirement]]:
+        """Liefert die passenden Anforderungen oder ``None``, falls ``cancelled()`` zutrifft.
+
+        ``statuses`` ist eine Momentaufnahme Code -> Status; fehlende Codes gelten als ``open``.
+        """
+        if query.module_code is not None:
+            candidates = self._module_ranges.get(query.module_code, range(0))
+        else:
+            candidates = range(len(self.requirements))
+        filters = []
+        if query.level:
+            filters.append(self._by_level.get(query.level, set()))
+        if query.role:
+            filters.append(self._by_role.get(query.role, set()))
+        if filters:
+            filters.sort(key=len)
+            selected = set(filters[0]).intersection(*filters[1:])
+            candidates = sorted(position for position in selected if position in candidates)
+
+        terms = query.text.lower().split()
+        haystacks = self._haystacks
+        result: List[Requirement] = []
+        for checked, position in enumerate(candidates):
+            if cancelled is not None and checked % CANCEL_CHECK_INTERVAL == 0 and cancelled():
+                return None
+            if terms and not all(term in haystacks[position] for term in terms):
+                continue
+            req = self.requirements[position]
+            if query.status != "all" and statuses.get(req.code, "open") != query.status:
+                continue
+            result.append(req)
+        return result
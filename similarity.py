@@ -0,0 +1,197 @@
+﻿from __future__ import annotations
+
+import hashlib
+import heapq
+import math
+import re
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ai_helper import AIHelpStore
+from column_file import ColumnFile, write_column_file
+from requirements_parser import Compendium
+
+INDEX_MAGIC = b"BSISIM4\n"
+DEFAULT_TOP_K = 10
+REUSE_MIN_SCORE = 0.35
+REUSE_PREFIX_RE = re.compile(r"\AUebernommen von \S+ \(Aehnlichkeit [\d.]+\):\n\n")
+# Terme, die in mehr als diesem Anteil aller Anforderungen vorkommen, tragen kaum zur
+# Unterscheidung bei, blaehen aber die Postings-Listen quadratisch auf.
+MAX_DOCUMENT_FREQUENCY = 0.5
+
+TOKEN_RE = re.compile(r"[^\W\d_]{3,}")
+STOPWORDS = frozenset(
+    """
+    aber alle allem allen aller alles als also auch auf aus bei beim bis das dass dem den der des die
+    dies diese diesem diesen dieser dieses durch ein eine einem einen einer eines fuer für gegen hat
+    haben ist kann koennen können muss muessen müssen nach nicht noch oder ohne sich sie sind soll
+    sollte sollten sowie ueber über und vom von vor werden wie wird zum zur zwischen
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in (match.lower() for match in TOKEN_RE.findall(text)) if token not in STOPWORDS]
+
+
+def compendium_fingerprint(compendium: Compendium) -> str:
+    digest = hashlib.sha1()
+    for code in sorted(compendium.requirements):
+        req = compendium.requirements[code]
+        digest.update(f"{code}\0{req.title}\0{req.description}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SimilarityIndex:
+    """Vorberechnete Top-k-Nachbarn je Anforderung (TF-IDF, Kosinus-Aehnlichkeit).
+
+    Geladene Indizes lesen Nachbarn und Werte per ``mmap`` direkt aus der Datei.
+    """
+
+    def __init__(
+        self,
+        fingerprint: str,
+        codes: List[str],
+        top_k: int,
+        neighbours: Sequence[int],
+        scores: Sequence[float],
+        column_file: Optional[ColumnFile] = None,
+    ):
+        self.fingerprint = fingerprint
+        self.codes = codes
+        self.top_k = top_k
+        self._neighbours = neighbours
+        self._scores = scores
+        self._file = column_file
+        self._positions = {code: position for position, code in enumerate(codes)}
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        self._neighbours = self._scores = None
+        self._file.close()
+        self._file = None
+
+    @classmethod
+    def build(cls, compendium: Compendium, top_k: int = DEFAULT_TOP_K) -> "SimilarityIndex":
+        codes = sorted(compendium.requirements)
+        documents = []
+        for code in codes:
+            req = compendium.requirements[code]
+            # Titel doppelt gewichten, da er die Anforderung am knappsten beschreibt
+            documents.append(Counter(tokenize(f"{req.title} {req.title} {req.description}")))
+
+        document_frequency: Counter = Counter()
+        for terms in documents:
+            document_frequency.update(terms.keys())
+        total = len(documents)
+        max_df = max(2, int(total * MAX_DOCUMENT_FREQUENCY))
+        idf = {term: math.log((1 + total) / (1 + df)) + 1.0 for term, df in document_frequency.items()}
+        # Einzel- und Allerweltsterme nur aus den Postings nehmen; die Norm umfasst alle Terme,
+        # sonst erreichen Dokumente mit nur einem gemeinsamen Wort eine Aehnlichkeit von 1.0
+        indexed_terms = {term for term, df in document_frequency.items() if 1 < df <= max_df}
+
+        vectors: List[Dict[str, float]] = []
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        for position, terms in enumerate(documents):
+            weights = {term: (1.0 + math.log(count)) * idf[term] for term, count in terms.items()}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+            if norm:
+                weights = {term: weight / norm for term, weight in weights.items()}
+            weights = {term: weight for term, weight in weights.items() if term in indexed_terms}
+            vectors.append(weights)
+            for term, weight in weights.items():
+                postings.setdefault(term, []).append((position, weight))
+
+        neighbours = array("i", [-1] * (total * top_k))
+        scores = array("f", [0.0] * (total * top_k))
+        for position, weights in enumerate(vectors):
+            accumulator: Dict[int, float] = {}
+            for term, weight in weights.items():
+                for other, other_weight in postings[term]:
+                    if other != position:
+                        accumulator[other] = accumulator.get(other, 0.0) + weight * other_weight
+            best = heapq.nlargest(top_k, accumulator.items(), key=lambda item: item[1])
+            base = position * top_k
+            for offset, (other, score) in enumerate(best):
+                neighbours[base + offset] = other
+                scores[base + offset] = score
+        return cls(compendium_fingerprint(compendium), codes, top_k, neighbours, scores)
+
+    def neighbours(self, requirement_code: str, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        position = self._positions.get(requirement_code)
+        if position is None:
+            return []
+        count = self.top_k if limit is None else min(limit, self.top_k)
+        base = position * self.top_k
+        result = []
+        for offset in range(count):
+            other = self._neighbours[base + offset]
+            if other < 0:
+                break
+            result.append((self.codes[other], float(self._scores[base + offset])))
+        return result
+
+    def save(self, path: Path) -> None:
+        """Schreibt den Index fuer ``load`` (Rahmenformat siehe ``column_file.write_column_file``)."""
+        header = {"fingerprint": self.fingerprint, "top_k": self.top_k, "codes": self.codes}
+        columns = {"neighbours": array("i", self._neighbours), "scores": array("f", self._scores)}
+        write_column_file(path, INDEX_MAGIC, header, columns)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["SimilarityIndex"]:
+        if not path.exists():
+            return None
+        try:
+            column_file = ColumnFile(path, INDEX_MAGIC)
+        except (OSError, ValueError):
+            return None
+        header = column_file.header
+        try:
+            size = len(header["codes"]) * header["top_k"]
+            neighbours, scores = column_file.columns["neighbours"], column_file.columns["scores"]
+            if len(neighbours) != size or len(scores) != size:
+                raise ValueError("Spaltenlaenge passt nicht zum Header")
+        except (KeyError, TypeError, ValueError):
+            column_file.close()
+            return None
+        return cls(header["fingerprint"], header["codes"], header["top_k"], neighbours, scores, column_file)
+
+
+def load_or_build_index(compendium: Compendium, path: Path, top_k: int = DEFAULT_TOP_K) -> SimilarityIndex:
+    index = SimilarityIndex.load(path)
+    if index is not None and index.top_k >= top_k and index.fingerprint == compendium_fingerprint(compendium):
+        return index
+    if index is not None:
+        # veraltete Datei freigeben, bevor sie ueberschrieben wird
+        index.close()
+    index = SimilarityIndex.build(compendium, top_k)
+    try:
+        index.save(path)
+    except OSError:
+        # Index ist nur ein Cache; ohne Schreibrechte wird er bei jedem Start neu berechnet
+        pass
+    return index
+
+
+def find_reusable_help(
+    index: SimilarityIndex,
+    help_store: AIHelpStore,
+    requirement_code: str,
+    min_score: float = REUSE_MIN_SCORE,
+) -> Optional[Tuple[str, float, str]]:
+    for code, score in index.neighbours(requirement_code):
+        if score < min_score:
+            break
+        content = help_store.get_help(code)
+        if content:
+            return code, score, content
+    return None
+
+
+def format_reused_help(source_code: str, score: float, content: str) -> str:
+    # bereits uebernommene Hilfe nicht mehrfach kennzeichnen
+    content = REUSE_PREFIX_RE.sub("", content, count=1)
+    return f"Uebernommen von {source_code} (Aehnlichkeit {score:.2f}):\n\n{content}"
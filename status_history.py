@@ -0,0 +1,269 @@
+﻿from __future__ import annotations
+
+import bisect
+import getpass
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class StatusEvent:
+    timestamp: str
+    user: str
+    requirement_code: str
+    old_status: Optional[str]
+    new_status: Optional[str]
+    old_note: Optional[str]
+    new_note: Optional[str]
+
+
+def default_user() -> str:
+    try:
+        return getpass.getuser()
+    except Exception:
+        return "unbekannt"
+
+
+def parse_date(value: str, end_of_day: bool = False) -> datetime:
+    """Wandelt ein ISO-Datum in einen UTC-Zeitpunkt um.
+
+    Reine Datumsangaben stehen fuer den Tagesbeginn bzw. mit ``end_of_day`` fuer den
+    Beginn des Folgetags, damit ``--until 2024-03-31`` den ganzen Tag einschliesst.
+    """
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) <= 10:
+        parsed += timedelta(days=1)
+    if parsed.tzinfo is None:
+        parsed = parsed.astimezone()
+    return parsed.astimezone(timezone.utc)
+
+
+class StatusHistory:
+    """Append-only Protokoll aller Status- und Notizaenderungen.
+
+    Die Ereignisse liegen als JSON Lines in ``path``. Daneben fuehrt ``<path>.idx`` je
+    Ereignis eine Zeile ``zeitstempel<TAB>offset<TAB>code``, sodass Zeitraum- und
+    Stichtagsabfragen per Binaersuche nur die benoetigten Ereignisse lesen muessen. Der
+    Index wird beim ersten Zugriff geladen.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.index_path = path.with_name(path.name + ".idx")
+        self._timestamps: List[float] = []
+        self._offsets: List[int] = []
+        # Positionen im Index je Anforderung, aufsteigend nach Zeit
+        self._by_code: Dict[str, List[int]] = {}
+        self._pending: List[StatusEvent] = []
+        self._default_user: Optional[str] = None
+        # Index erst beim ersten Lesen bzw. Schreiben laden; Befehle ohne Protokollzugriff
+        # sollen das Dateisystem nicht anfassen
+        self._loaded = False
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self._loaded = True
+            self._load_index()
+
+    def _load_index(self) -> None:
+        if not self.path.exists():
+            # Index ohne Protokoll (z. B. nach Rotation) wuerde auf fremde Offsets zeigen
+            if self.index_path.exists():
+                self.index_path.unlink()
+            return
+        log_size = self.path.stat().st_size
+        if self.index_path.exists():
+            last_code = None
+            consistent = True
+            with self.index_path.open("r", encoding="utf-8") as handle:
+                for line in handle:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 3:
+                        continue
+                    try:
+                        timestamp, offset = float(parts[0]), int(parts[1])
+                    except ValueError:
+                        continue
+                    if self._offsets and offset <= self._offsets[-1]:
+                        consistent = False
+                        break
+                    self._add_to_index(timestamp, offset, parts[2])
+                    last_code = parts[2]
+            if not consistent or not self._index_matches_log(log_size, last_code):
+                self._reset_index()
+        self._reindex_tail(log_size)
+
+    def _index_matches_log(self, log_size: int, last_code: Optional[str]) -> bool:
+        # Der letzte Indexeintrag muss im Log liegen und auf ein Ereignis desselben Codes zeigen
+        if not self._offsets:
+            return True
+        if self._offsets[-1] >= log_size:
+            return False
+        with self.path.open("rb") as handle:
+            handle.seek(self._offsets[-1])
+            try:
+                event = json.loads(handle.readline().decode("utf-8"))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                return False
+        return isinstance(event, dict) and event.get("requirement_code") == last_code
+
+    def _reset_index(self) -> None:
+        self._timestamps = []
+        self._offsets = []
+        self._by_code = {}
+        self.index_path.unlink()
+
+    def _reindex_tail(self, log_size: int) -> None:
+        # Ereignisse, die im Log, aber (z. B. nach einem Abbruch) nicht im Index stehen, nachtragen
+        entries: List[Tuple[float, int, str]] = []
+        with self.path.open("rb") as handle:
+            if self._offsets:
+                handle.seek(self._offsets[-1])
+                handle.readline()
+            offset = handle.tell()
+            if offset >= log_size:
+                return
+            for raw in handle:
+                if raw.strip():
+                    try:
+                        event = StatusEvent(**json.loads(raw.decode("utf-8")))
+                    except (json.JSONDecodeError, TypeError, UnicodeDecodeError):
+                        offset += len(raw)
+                        continue
+                    entries.append((_epoch(event.timestamp), offset, event.requirement_code))
+                offset += len(raw)
+        if not entries:
+            return
+        with self.index_path.open("a", encoding="utf-8") as handle:
+            for timestamp, event_offset, code in entries:
+                handle.write(f"{timestamp:.6f}\t{event_offset}\t{code}\n")
+                self._add_to_index(timestamp, event_offset, code)
+
+    def _add_to_index(self, timestamp: float, offset: int, code: str) -> None:
+        if self._timestamps and timestamp < self._timestamps[-1]:
+            # Uhrzeit wurde zurueckgestellt; Reihenfolge im Log bleibt massgeblich
+            timestamp = self._timestamps[-1]
+        self._by_code.setdefault(code, []).append(len(self._timestamps))
+        self._timestamps.append(timestamp)
+        self._offsets.append(offset)
+
+    def record(
+        self,
+        requirement_code: str,
+        old: Optional[Dict[str, str]],
+        new: Dict[str, str],
+        user: Optional[str] = None,
+        timestamp: Optional[datetime] = None,
+    ) -> None:
+        old = old or {}
+        # fehlende und leere Notizen sind gleichwertig und werden nicht protokolliert
+        old_note = old.get("note") or None
+        new_note = new.get("note") or None
+        if old.get("status") == new.get("status") and old_note == new_note:
+            return
+        self._pending.append(
+            StatusEvent(
+                timestamp=(timestamp or datetime.now(timezone.utc)).isoformat(timespec="microseconds"),
+                user=user or self._resolve_default_user(),
+                requirement_code=requirement_code,
+                old_status=old.get("status"),
+                new_status=new.get("status"),
+                old_note=old_note,
+                new_note=new_note,
+            )
+        )
+
+    def _resolve_default_user(self) -> str:
+        if self._default_user is None:
+            self._default_user = default_user()
+        return self._default_user
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        self._ensure_loaded()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        index_lines = []
+        with self.path.open("ab") as handle:
+            offset = handle.tell()
+            for event in self._pending:
+                line = (json.dumps(vars(event), ensure_ascii=False) + "\n").encode("utf-8")
+                handle.write(line)
+                timestamp = _epoch(event.timestamp)
+                index_lines.append(f"{timestamp:.6f}\t{offset}\t{event.requirement_code}\n")
+                self._add_to_index(timestamp, offset, event.requirement_code)
+                offset += len(line)
+        with self.index_path.open("a", encoding="utf-8") as handle:
+            handle.writelines(index_lines)
+        self._pending = []
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._timestamps)
+
+    def events_for(self, requirement_code: str) -> List[StatusEvent]:
+        self._ensure_loaded()
+        return self._read_events(self._by_code.get(requirement_code, []))
+
+    def changes(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[StatusEvent]:
+        self._ensure_loaded()
+        start = bisect.bisect_left(self._timestamps, since.timestamp()) if since else 0
+        end = bisect.bisect_left(self._timestamps, until.timestamp()) if until else len(self._timestamps)
+        return self._read_events(range(start, end))
+
+    def state_as_of(
+        self, when: datetime, current: Optional[Dict[str, Dict[str, str]]] = None
+    ) -> Dict[str, Dict[str, str]]:
+        """Rekonstruiert die Statuswerte zum Zeitpunkt ``when`` (exklusive).
+
+        Pro Anforderung wird nur das letzte Ereignis vor ``when`` gelesen, nicht das
+        ganze Log abgespielt. Liegt das erste Ereignis einer Anforderung nach ``when``, gilt
+        dessen alter Wert. Anforderungen ohne Ereignisse (z. B. gepflegt, bevor das Protokoll
+        existierte) werden aus ``current``, dem aktuellen Stand des Stores, uebernommen.
+        """
+        self._ensure_loaded()
+        limit = bisect.bisect_left(self._timestamps, when.timestamp())
+        latest: List[int] = []
+        earliest: List[int] = []
+        for positions in self._by_code.values():
+            # Positionen sind global aufsteigend sortiert, daher genuegt ein Vergleich mit der Grenze
+            count = bisect.bisect_left(positions, limit)
+            if count:
+                latest.append(positions[count - 1])
+            else:
+                earliest.append(positions[0])
+        state: Dict[str, Dict[str, str]] = {}
+        for code, record in (current or {}).items():
+            if code not in self._by_code:
+                state[code] = record
+        for event in self._read_events(sorted(earliest)):
+            _set_state(state, event.requirement_code, event.old_status, event.old_note)
+        for event in self._read_events(sorted(latest)):
+            _set_state(state, event.requirement_code, event.new_status, event.new_note)
+        return dict(sorted(state.items()))
+
+    def _read_events(self, positions) -> List[StatusEvent]:
+        events: List[StatusEvent] = []
+        if not self.path.exists():
+            return events
+        with self.path.open("rb") as handle:
+            for position in positions:
+                handle.seek(self._offsets[position])
+                events.append(StatusEvent(**json.loads(handle.readline().decode("utf-8"))))
+        return events
+
+
+def _set_state(state: Dict[str, Dict[str, str]], code: str, status: Optional[str], note: Optional[str]) -> None:
+    if status is None:
+        return
+    record = {"status": status}
+    if note:
+        record["note"] = note
+    state[code] = record
+
+
+def _epoch(timestamp: str) -> float:
+    return datetime.fromisoformat(timestamp).timestamp()
@@ -0,0 +1,176 @@
+﻿from __future__ import annotations
+
+import csv
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from requirements_parser import Compendium
+from status_store import StatusStore, VALID_STATUSES
+
+IMPORT_FORMATS = ["csv", "json", "jsonl"]
+CODE_COLUMNS = ("code", "requirement_code", "anforderung")
+STATUS_COLUMNS = ("status",)
+NOTE_COLUMNS = ("note", "notiz", "kommentar")
+
+
+@dataclass
+class StatusChange:
+    requirement_code: str
+    old_status: Optional[str]
+    new_status: str
+    old_note: Optional[str]
+    new_note: Optional[str]
+
+
+@dataclass
+class ImportResult:
+    changes: List[StatusChange] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    rows: int = 0
+
+
+def detect_format(path: Path) -> str:
+    suffix = path.suffix.lower().lstrip(".")
+    if suffix in IMPORT_FORMATS:
+        return suffix
+    if suffix == "ndjson":
+        return "jsonl"
+    raise ValueError(f"Unbekanntes Importformat fuer {path.name}. Erlaubt: {', '.join(IMPORT_FORMATS)}")
+
+
+def read_rows(path: Path, import_format: Optional[str] = None) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Liefert (Zeilennummer, Zeile) fuer CSV-, JSON- und JSON-Lines-Dateien.
+
+    CSV und JSON Lines werden zeilenweise gelesen. JSON darf eine Liste von Objekten oder
+    ein Objekt im Format von ``status.json`` (Code -> {status, note}) sein.
+    """
+    import_format = import_format or detect_format(path)
+    if import_format == "csv":
+        yield from _read_csv(path)
+    elif import_format == "jsonl":
+        with path.open("r", encoding="utf-8-sig") as handle:
+            for line_number, line in enumerate(handle, start=1):
+                if line.strip():
+                    yield line_number, _json_row(line)
+    elif import_format == "json":
+        with path.open("r", encoding="utf-8-sig") as handle:
+            data = json.load(handle)
+        if isinstance(data, dict):
+            for position, (code, record) in enumerate(data.items(), start=1):
+                record = record if isinstance(record, dict) else {"status": record}
+                yield position, {**record, "code": code}
+        elif isinstance(data, list):
+            for position, record in enumerate(data, start=1):
+                yield position, record if isinstance(record, dict) else {"_error": "Eintrag ist kein JSON-Objekt."}
+        else:
+            raise ValueError("JSON-Import erwartet eine Liste oder ein Objekt.")
+    else:
+        raise ValueError(f"Unbekanntes Importformat: {import_format}")
+
+
+def plan_import(
+    rows: Iterable[Tuple[int, Dict[str, str]]],
+    compendium: Compendium,
+    store: StatusStore,
+    replace_notes: bool = False,
+) -> ImportResult:
+    """Prueft alle Zeilen und berechnet die Aenderungen, ohne den Store anzufassen.
+
+    Notizen: Standard ist Zusammenfuehren, d. h. leere Notizfelder lassen die vorhandene
+    Notiz stehen. Mit ``replace_notes`` ersetzt die Importdatei die Notiz immer, leere
+    Felder loeschen sie.
+    """
+    result = ImportResult()
+    planned: Dict[str, StatusChange] = {}
+    for line_number, row in rows:
+        result.rows += 1
+        if row.get("_error"):
+            result.errors.append(f"Zeile {line_number}: {row['_error']}")
+            continue
+        fields = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+        code = _first(fields, CODE_COLUMNS)
+        status = (_first(fields, STATUS_COLUMNS) or "").lower()
+        note = _first(fields, NOTE_COLUMNS)
+        if not code:
+            result.errors.append(f"Zeile {line_number}: Anforderungscode fehlt.")
+            continue
+        if code not in compendium.requirements:
+            result.errors.append(f"Zeile {line_number}: Anforderung {code} nicht gefunden.")
+            continue
+        if status not in VALID_STATUSES:
+            result.errors.append(
+                f"Zeile {line_number}: Ungueltiger Status '{status}' fuer {code}. Erlaubt: {', '.join(VALID_STATUSES)}"
+            )
+            continue
+
+        current = store.get(code) or {}
+        if replace_notes:
+            # None bedeutet hier: Notiz loeschen (siehe apply_import)
+            new_note = note
+        else:
+            new_note = note or current.get("note")
+        # mehrfach vorkommende Codes: die letzte Zeile gewinnt
+        planned[code] = StatusChange(
+            requirement_code=code,
+            old_status=current.get("status"),
+            new_status=status,
+            old_note=current.get("note"),
+            new_note=new_note,
+        )
+
+    for change in planned.values():
+        # Anforderungen ohne Eintrag gelten als "open"
+        if (change.old_status or "open") == change.new_status and (change.old_note or "") == (change.new_note or ""):
+            result.unchanged += 1
+        else:
+            result.changes.append(change)
+    return result
+
+
+def apply_import(result: ImportResult, store: StatusStore) -> None:
+    """Uebernimmt alle geplanten Aenderungen und schreibt den Store genau einmal.
+
+    ``new_note`` enthaelt bereits die zusammengefuehrte Notiz; ``None`` loescht sie daher.
+    """
+    if not result.changes:
+        return
+    for change in result.changes:
+        store.set_status(
+            change.requirement_code, change.new_status, change.new_note, clear_note=change.new_note is None
+        )
+    store.save()
+
+
+def _read_csv(path: Path) -> Iterator[Tuple[int, Dict[str, str]]]:
+    with path.open("r", encoding="utf-8-sig", newline="") as handle:
+        sample = handle.read(4096)
+        handle.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(handle, dialect=dialect)
+        for row in reader:
+            # Zeile 1 ist die Kopfzeile
+            yield reader.line_num, row
+
+
+def _json_row(line: str) -> Dict[str, str]:
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as error:
+        return {"_error": f"Ungueltiges JSON: {error.msg}."}
+    return record if isinstance(record, dict) else {"_error": "Eintrag ist kein JSON-Objekt."}
+
+
+def _first(fields: Dict[str, object], names: Tuple[str, ...]) -> Optional[str]:
+    for name in names:
+        value = fields.get(name)
+        if value is not None:
+            value = str(value).strip()
+            if value:
+                return value
+    return None
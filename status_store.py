@@ -1,15 +1,20 @@
 ﻿from __future__ import annotations
 
 import json
+import os
 from pathlib import Path
 from typing import Dict, Optional
 
+from status_history import StatusHistory
+
 VALID_STATUSES = ["open", "in_progress", "done", "not_applicable"]
 
 
 class StatusStore:
-    def __init__(self, path: Path):
+    def __init__(self, path: Path, history: Optional[StatusHistory] = None, user: Optional[str] = None):
         self.path = path
+        self.history = history
+        self.user = user
         self._data: Dict[str, Dict[str, str]] = {}
         self._load()
 
@@ -25,8 +30,15 @@ class StatusStore:
 
     def save(self) -> None:
         self.path.parent.mkdir(parents=True, exist_ok=True)
-        with self.path.open("w", encoding="utf-8") as handle:
+        # erst in eine temporaere Datei schreiben, damit status.json nie halb geschrieben ist
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with temp_path.open("w", encoding="utf-8") as handle:
             json.dump(self._data, handle, indent=2, ensure_ascii=False)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, self.path)
+        if self.history is not None:
+            self.history.flush()
 
     def get(self, requirement_code: str) -> Optional[Dict[str, str]]:
         return self._data.get(requirement_code)
@@ -37,13 +49,26 @@ class StatusStore:
             return record.get("status")
         return None
 
-    def set_status(self, requirement_code: str, status: str, note: Optional[str] = None) -> None:
+    def set_status(
+        self, requirement_code: str, status: str, note: Optional[str] = None, clear_note: bool = False
+    ) -> None:
+        """Setzt den Status; ohne ``note`` bleibt die bisherige Notiz, ``clear_note`` entfernt sie."""
         if status not in VALID_STATUSES:
             raise ValueError(f"UngÃ¼ltiger Status: {status}. Erlaubt: {', '.join(VALID_STATUSES)}")
 
-        self._data[requirement_code] = {"status": status}
-        if note is not None:
-            self._data[requirement_code]["note"] = note
+        previous = self._data.get(requirement_code)
+        record = {"status": status}
+        if note:
+            record["note"] = note
+        elif note is None and not clear_note and previous and previous.get("note"):
+            # ohne neue Notiz bleibt die bisherige erhalten
+            record["note"] = previous["note"]
+        self._data[requirement_code] = record
+        if self.history is not None:
+            self.history.record(requirement_code, previous, record, self.user)
+
+    def status_map(self) -> Dict[str, str]:
+        return {req_code: data.get("status", "open") for req_code, data in self._data.items()}
 
     def iter_statuses(self):
         for req_code, data in sorted(self._data.items()):
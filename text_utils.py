@@ -1,5 +1,8 @@
 ﻿from __future__ import annotations
 
+import re
+from functools import lru_cache
+
 TRANSLATION_TABLE = str.maketrans(
     {
         "\u2013": "-",
@@ -21,3 +24,51 @@ def normalize_text(value: str | None) -> str:
     except (UnicodeEncodeError, UnicodeDecodeError):
         candidate = value
     return candidate.translate(TRANSLATION_TABLE)
+
+
+# Ein UTF-8-Folgezeichen, das als latin1 gelesen wurde: Startbyte C2-F4 gefolgt von 80-BF.
+# Ohne ein solches Paar kann der latin1->utf-8-Versuch in normalize_text nie gelingen.
+MOJIBAKE_RE = re.compile("[\xc2-\xf4][\x80-\xbf]")
+SHORT_TEXT_LIMIT = 256
+_REPLACEMENTS = tuple((chr(source), target) for source, target in TRANSLATION_TABLE.items())
+
+
+def needs_repair(text: str) -> bool:
+    return not text.isascii() and MOJIBAKE_RE.search(text) is not None
+
+
+class TextNormalizer:
+    """Liefert exakt dieselben Ergebnisse wie ``normalize_text``, nur schneller.
+
+    Mit ``scan`` wird einmal je Dokument bzw. Abschnitt geprueft, ob ueberhaupt eine
+    Mojibake-Reparatur in Frage kommt; sonst entfaellt der Versuch mit Ausnahme komplett.
+    Kurze, sich wiederholende Texte (Kapitel, Rollen, Titel) landen in einem begrenzten
+    Cache. Da das Ergebnis nicht vom Scan-Zustand abhaengt, ist der Cache immer gueltig.
+    """
+
+    def __init__(self, cache_size: int = 4096):
+        self.repair_possible = True
+        self._normalize_short = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def scan(self, text: str) -> None:
+        self.repair_possible = needs_repair(text)
+
+    def __call__(self, value: str | None) -> str:
+        if not value:
+            return ""
+        if len(value) <= SHORT_TEXT_LIMIT:
+            return self._normalize_short(value)
+        return self._normalize(value)
+
+    def _normalize(self, value: str) -> str:
+        if value.isascii():
+            return value
+        if self.repair_possible and MOJIBAKE_RE.search(value):
+            try:
+                value = value.encode("latin1").decode("utf-8")
+            except (UnicodeEncodeError, UnicodeDecodeError):
+                pass
+        for source, target in _REPLACEMENTS:
+            if source in value:
+                value = value.replace(source, target)
+        return value